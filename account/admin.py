@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib import admin
 from django.contrib.auth.models import Group as DefaultGroup
+from django.db import models
+from chillsip.images import DownscaledImageField
 from .models import *
 
 
@@ -25,6 +27,9 @@ class UserAdmin(admin.ModelAdmin):
         'gender',
         'date_joined',
     ]
+    formfield_overrides = {
+        models.ImageField:{'form_class':DownscaledImageField},
+    }
 
 @admin.register(SuspiciousUser)
 class SuspiciousUserAdmin(admin.ModelAdmin):
@@ -2,6 +2,7 @@ from decimal import Decimal
 from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import AuthenticationForm,UserCreationForm
+from chillsip.images import DownscaledImageField
 
 
 class UserRegisterForm(UserCreationForm):
@@ -37,6 +38,9 @@ class UserUpdateForm(forms.ModelForm):
             'gender',
             'foto'
         ]
+        field_classes = {
+            'foto':DownscaledImageField,
+        }
 
 
 class MoneyUpdateForm(forms.ModelForm):
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0009_alter_suspicioususer_created_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='foto_height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Высота изображения'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='foto_placeholder',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Превью изображения'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='foto_width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина изображения'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 09:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0011_user_foto_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='foto_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Копии изображения созданы'),
+        ),
+    ]
@@ -5,6 +5,7 @@ from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import Group as DefaultGroup,BaseUserManager
 from django.core.validators import MinValueValidator,MaxValueValidator
 from autoslug import AutoSlugField 
+from chillsip.storage import get_content_storage
 
 
 class UserManager(BaseUserManager):
@@ -73,10 +74,34 @@ class User(AbstractUser):
     )
     foto= models.ImageField(
         upload_to='foto/%Y/%m/%d',
+        storage=get_content_storage,
         blank=True,
         null=True,
         verbose_name='Фотография',
     )
+    foto_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ширина изображения',
+    )
+    foto_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Высота изображения',
+    )
+    foto_placeholder = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Превью изображения',
+    )
+    foto_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Копии изображения созданы',
+    )
     age = models.IntegerField(
         validators=[MinValueValidator(1),MaxValueValidator(150)],
         blank=True,
@@ -0,0 +1,19 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_save,pre_save
+from django.dispatch import receiver
+from chillsip.images import delete_replaced_variants,fill_image_meta,remember_image
+
+
+@receiver(pre_save,sender=get_user_model())
+def fill_foto_meta(sender,instance,update_fields=None,**kwargs):
+    fill_image_meta(instance,'foto',update_fields)
+
+
+@receiver(pre_save,sender=get_user_model())
+def remember_foto(sender,instance,update_fields=None,**kwargs):
+    remember_image(instance,'foto',update_fields)
+
+
+@receiver(post_save,sender=get_user_model())
+def delete_replaced_foto_variants(sender,instance,**kwargs):
+    delete_replaced_variants(instance,'foto')
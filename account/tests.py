@@ -391,6 +391,49 @@ class UserUpdateFormTest(TestCase):
         self.assertFalse(form.is_valid(), form.errors)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class UserFotoDownscaleTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='securepass123')
+
+    def tearDown(self):
+        if os.path.exists(TEMP_MEDIA_ROOT):
+            shutil.rmtree(TEMP_MEDIA_ROOT)
+
+    def upload(self, size, mode='RGB', image_format='JPEG', name='foto.jpg'):
+        buffer = BytesIO()
+        Image.new(mode, size).save(buffer, format=image_format)
+        foto = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+        return UserUpdateForm(data={'email': 'test@example.com'}, files={'foto': foto}, instance=self.user)
+
+    def test_small_upload_kept(self):
+        form = self.upload((800, 600))
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data['foto'].name, 'foto.jpg')
+
+    def test_large_upload_downscaled(self):
+        form = self.upload((4000, 3000))
+        self.assertTrue(form.is_valid(), form.errors)
+        user = form.save()
+
+        with Image.open(user.foto.path) as image:
+            self.assertEqual(image.size, (2560, 1920))
+            self.assertEqual(image.format, 'JPEG')
+
+    def test_transparent_upload_kept_as_png(self):
+        form = self.upload((3000, 1000), mode='RGBA', image_format='PNG', name='logo.png')
+        self.assertTrue(form.is_valid(), form.errors)
+
+        foto = form.cleaned_data['foto']
+        self.assertEqual(foto.name, 'logo.png')
+        self.assertEqual(Image.open(foto).size, (2560, 853))
+
+    def test_decompression_bomb_rejected(self):
+        form = self.upload((8000, 8000), mode='1', image_format='PNG', name='bomb.png')
+        self.assertFalse(form.is_valid())
+        self.assertIn('не более 50 Мп', form.errors['foto'][0])
+
+
 class MoneyUpdateFormTest(TestCase):
 
     def setUp(self):
@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db import models
+from chillsip.images import DownscaledImageField
 from .models import *
 
 
@@ -16,6 +18,9 @@ class PostAdmin(admin.ModelAdmin):
         'is_published',
         'created',
     ]
+    formfield_overrides = {
+        models.ImageField:{'form_class':DownscaledImageField},
+    }
 
 
 @admin.register(Comment)
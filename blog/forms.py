@@ -1,5 +1,6 @@
 from .models import *
 from django import forms
+from chillsip.images import DownscaledImageField
 
 class CommentForm(forms.ModelForm):
 
@@ -17,3 +18,6 @@ class PostForm(forms.ModelForm):
             'content',
             'image',    
         ]
+        field_classes = {
+            'image':DownscaledImageField,
+        }
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:53
+
+import chillsip.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=chillsip.storage.get_content_storage, upload_to='posts/%Y/%m/%d', verbose_name='Изображение'),
+        ),
+    ]
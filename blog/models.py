@@ -3,6 +3,7 @@ from uuid import uuid4
 from django.conf import settings
 from autoslug import AutoSlugField
 from django.urls import reverse
+from chillsip.storage import get_content_storage
 
 
 class Post(models.Model):
@@ -32,10 +33,34 @@ class Post(models.Model):
     )
     image = models.ImageField(
         upload_to='posts/%Y/%m/%d',
+        storage=get_content_storage,
         blank=True,
         null=True,
         verbose_name='Изображение'
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ширина изображения'
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Высота изображения'
+    )
+    image_placeholder = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Превью изображения'
+    )
+    image_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Копии изображения созданы'
+    )
     is_published = models.BooleanField(
         default=False,
         verbose_name='Опубликован'
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_delete,post_save,pre_save
+from django.dispatch import receiver
+from chillsip.images import delete_replaced_variants,fill_image_meta,remember_image
+from chillsip.stamps import bump_stamp
+from .models import Comment,Post
+
+
+@receiver(post_save,sender=Post)
+@receiver(post_delete,sender=Post)
+def touch_post_page(sender,instance,**kwargs):
+    bump_stamp('post',instance.slug,'all')
+
+
+@receiver(pre_save,sender=Post)
+def fill_post_image_meta(sender,instance,update_fields=None,**kwargs):
+    fill_image_meta(instance,'image',update_fields)
+
+
+@receiver(pre_save,sender=Post)
+def remember_post_image(sender,instance,update_fields=None,**kwargs):
+    remember_image(instance,'image',update_fields)
+
+
+@receiver(post_save,sender=Post)
+def delete_replaced_post_image_variants(sender,instance,**kwargs):
+    delete_replaced_variants(instance,'image')
+
+
+@receiver(post_save,sender=Comment)
+@receiver(post_delete,sender=Comment)
+def touch_comment_post_page(sender,instance,**kwargs):
+    bump_stamp('post',Post.objects.filter(pk=instance.post_id).values_list('slug',flat=True).first())
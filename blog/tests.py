@@ -1,4 +1,5 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from blog.models import *
 from blog.forms import *
@@ -160,6 +161,9 @@ class PostListViewTest(TestCase):
             is_published=False
         )
             
+    def setUp(self):
+        cache.clear()
+
     def test_view_url_exists_at_desired_location(self):
         response = self.client.get('/blog/') 
         self.assertEqual(response.status_code, 200)
@@ -257,6 +261,9 @@ class PostDetailViewTest(TestCase):
                 content=f'Комментарий {i}',
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_post_detail_status_and_template(self):
         url = reverse('blog:post_detail', args=[self.post.slug])
         response = self.client.get(url)
@@ -286,6 +293,47 @@ class PostDetailViewTest(TestCase):
         comments_page3 = response3.context['comments']
         self.assertEqual(len(comments_page3.object_list), 2)
 
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PostConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='shadow', password='pass123', email='test@email.com')
+        self.post = Post.objects.create(user=self.user, name='Условный пост', content='Контент', is_published=True)
+        self.url = reverse('blog:post_detail', args=[self.post.slug])
+
+    def test_not_modified_for_matching_etag(self):
+        response = self.client.get(self.url)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_modified_since(self):
+        response = self.client.get(self.url)
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_comment_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Comment.objects.create(post=self.post, user=self.user, content='Новый комментарий')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый комментарий')
+
+    def test_no_validators_for_authenticated_user(self):
+        self.client.login(username='shadow', password='pass123')
+        response = self.client.get(self.url)
+        self.assertNotIn('ETag', response)
+
+    def test_anonymous_page_cached_without_csrf_token(self):
+        response = self.client.get(self.url)
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.templates, [])
+        self.assertContains(response, reverse('account:login'))
+
 class CommentCreateViewTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='shadow', password='pass123',email='test@email.com')
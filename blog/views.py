@@ -6,8 +6,32 @@ from django.views.generic import ListView,DetailView,CreateView,TemplateView
 from .forms import *
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.decorators import method_decorator
+from chillsip.pagecache import cache_anonymous_page
+from chillsip.stamps import get_stamp,stamp_condition
 
 
+def get_request_post_stamp(request,slug,**kwargs):
+    def compute():
+        modified = Post.objects.filter(slug=slug).aggregate(
+            updated=Max('updated'),
+            comment=Max('comments__updated'),
+        )
+        return max(filter(None,modified.values()),default=None)
+
+    return get_stamp('post',slug,compute)
+
+
+def get_request_post_list_stamp(request,**kwargs):
+    return get_stamp(
+        'post',
+        'all',
+        lambda: Post.objects.filter(is_published=True).aggregate(updated=Max('updated'))['updated'],
+    )
+
+
+@method_decorator(cache_anonymous_page(get_request_post_list_stamp),name='dispatch')
 class PostListView(ListView):
     queryset = Post.objects.filter(is_published = True).order_by('-created')
     context_object_name = 'posts'
@@ -33,6 +57,10 @@ class PostCreateDoneView(LoginRequiredMixin,TemplateView):
     template_name = 'blog/post_done.html'
 
 
+@method_decorator(
+    [stamp_condition('post',get_request_post_stamp),cache_anonymous_page(get_request_post_stamp)],
+    name='dispatch',
+)
 class PostDetailView(DetailView):
     model = Post
     context_object_name = 'post'
@@ -0,0 +1,234 @@
+import os
+from base64 import b64encode
+from io import BytesIO
+from pathlib import PurePosixPath
+from django import forms
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import models,transaction
+from PIL import Image,ImageOps,UnidentifiedImageError
+
+
+VARIANTS_DIR = 'variants'
+VARIANT_WIDTHS = (160,320,640,1280)
+VARIANT_FORMATS = (
+    ('webp','WEBP','image/webp',{'quality':80,'method':4}),
+    ('jpg','JPEG','image/jpeg',{'quality':85,'optimize':True,'progressive':True}),
+)
+IMAGE_DIRS = ('products','posts','foto')
+MAX_UPLOAD_PIXELS = 50_000_000
+MAX_UPLOAD_SIDE = 2560
+UPLOAD_FORMATS = {'JPEG','PNG','WEBP'}
+PLACEHOLDER_SIZE = 16
+
+
+def get_variant_name(name,width,ext):
+    path = PurePosixPath(name)
+    return str(PurePosixPath(VARIANTS_DIR) / path.parent / f'{path.stem}_{width}w.{ext}')
+
+
+def get_variant_names(name):
+    return [
+        get_variant_name(name,width,ext)
+        for width in VARIANT_WIDTHS
+        for ext,*_ in VARIANT_FORMATS
+    ]
+
+
+def has_variants(name,storage=default_storage):
+    return all(storage.exists(variant) for variant in get_variant_names(name))
+
+
+def get_variant_widths(image_width=None):
+    widths = []
+    for width in VARIANT_WIDTHS:
+        if image_width and width >= image_width:
+            widths.append((width,image_width))
+            break
+        widths.append((width,width))
+    return widths
+
+
+def open_image(name,storage=default_storage):
+    with storage.open(name,'rb') as f:
+        image = Image.open(f)
+        image.draft('RGB',(max(VARIANT_WIDTHS),max(VARIANT_WIDTHS)))
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGB') if image.mode != 'RGB' else image
+
+
+def generate_variants(name,storage=default_storage,force=False):
+    missing = [variant for variant in get_variant_names(name) if force or not storage.exists(variant)]
+    if not missing:
+        return 0
+
+    try:
+        image = open_image(name,storage)
+    except (FileNotFoundError,UnidentifiedImageError,OSError) as e:
+        print(e)
+        return 0
+
+    created = 0
+    for width in sorted(VARIANT_WIDTHS,reverse=True):
+        if image.width > width:
+            image.thumbnail((width,image.height),Image.Resampling.LANCZOS)
+
+        for ext,image_format,content_type,options in VARIANT_FORMATS:
+            variant = get_variant_name(name,width,ext)
+            if variant not in missing:
+                continue
+            buffer = BytesIO()
+            image.save(buffer,image_format,**options)
+            if storage.exists(variant):
+                storage.delete(variant)
+            storage.save(variant,ContentFile(buffer.getvalue()))
+            created += 1
+
+    return created
+
+
+def downscale_upload(upload):
+    upload.seek(0)
+    image = Image.open(upload)
+
+    if image.width * image.height > MAX_UPLOAD_PIXELS:
+        raise ValidationError(
+            f'Изображение слишком большое: не более {MAX_UPLOAD_PIXELS // 1_000_000} Мп',
+            code='too_many_pixels',
+        )
+
+    orientation = image.getexif().get(0x0112,1)
+    if image.format in UPLOAD_FORMATS and max(image.size) <= MAX_UPLOAD_SIDE and orientation == 1:
+        upload.seek(0)
+        return upload
+
+    image.draft('RGB',(MAX_UPLOAD_SIDE,MAX_UPLOAD_SIDE))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_UPLOAD_SIDE,MAX_UPLOAD_SIDE),Image.Resampling.LANCZOS,reducing_gap=3.0)
+
+    buffer = BytesIO()
+    if image.mode in ('RGBA','LA','P'):
+        image_format,ext,content_type = 'PNG','png','image/png'
+        image.save(buffer,image_format,optimize=True)
+    else:
+        image_format,ext,content_type = 'JPEG','jpg','image/jpeg'
+        image.convert('RGB').save(buffer,image_format,quality=85,optimize=True,progressive=True)
+
+    name = f'{PurePosixPath(upload.name).stem}.{ext}'
+    return SimpleUploadedFile(name,buffer.getvalue(),content_type)
+
+
+class DownscaledImageField(forms.ImageField):
+    def to_python(self,data):
+        upload = super().to_python(data)
+        if upload is None:
+            return None
+
+        try:
+            return downscale_upload(upload)
+        except (OSError,Image.DecompressionBombError) as e:
+            raise ValidationError(self.error_messages['invalid_image'],code='invalid_image') from e
+
+
+def read_image_meta(file):
+    with Image.open(file) as image:
+        width,height = image.size
+        if image.getexif().get(0x0112,1) in (5,6,7,8):
+            width,height = height,width
+
+        image.draft('RGB',(PLACEHOLDER_SIZE * 4,PLACEHOLDER_SIZE * 4))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((PLACEHOLDER_SIZE,PLACEHOLDER_SIZE))
+        buffer = BytesIO()
+        image.convert('RGB').save(buffer,'WEBP',quality=40)
+
+    return width,height,f'data:image/webp;base64,{b64encode(buffer.getvalue()).decode("ascii")}'
+
+
+def get_image_meta(name,storage=default_storage):
+    try:
+        with storage.open(name,'rb') as f:
+            return read_image_meta(f)
+    except (OSError,ValueError) as e:
+        print(e)
+        return None
+
+
+def fill_image_meta(instance,field_name,update_fields=None):
+    file = getattr(instance,field_name)
+    placeholder = getattr(instance,f'{field_name}_placeholder')
+    if update_fields or (file and file._committed and placeholder) or (not file and not placeholder):
+        return
+
+    meta = None,None,''
+    if file:
+        committed = file._committed
+        try:
+            if committed:
+                file.open('rb')
+            file.seek(0)
+            meta = read_image_meta(file)
+        except (OSError,ValueError):
+            pass
+        finally:
+            if committed:
+                file.close()
+            else:
+                file.seek(0)
+
+    for suffix,value in zip(('width','height','placeholder'),meta):
+        setattr(instance,f'{field_name}_{suffix}',value)
+
+
+def delete_variants(name,storage=default_storage):
+    for variant in get_variant_names(name):
+        storage.delete(variant)
+
+
+def find_images(root):
+    for directory in IMAGE_DIRS:
+        for dirpath,dirnames,filenames in os.walk(os.path.join(root,directory)):
+            for filename in filenames:
+                yield os.path.relpath(os.path.join(dirpath,filename),root).replace(os.sep,'/')
+
+
+def is_referenced(name):
+    return any(
+        model._default_manager.filter(**{field.name:name}).exists()
+        for model in apps.get_models()
+        for field in model._meta.fields
+        if isinstance(field,models.ImageField)
+    )
+
+
+def remember_image(instance,field_name,update_fields=None):
+    file = getattr(instance,field_name)
+    flag = f'{field_name}_variants'
+    setattr(instance,f'_previous_{field_name}',None)
+    if instance._state.adding or (update_fields and field_name not in update_fields):
+        return
+    if (file and file._committed) or (not file and not getattr(instance,flag)):
+        return
+
+    setattr(instance,flag,False)
+    setattr(
+        instance,
+        f'_previous_{field_name}',
+        type(instance)._default_manager.filter(pk=instance.pk).values_list(field_name,flat=True).first(),
+    )
+
+
+def delete_replaced_variants(instance,field_name):
+    previous = getattr(instance,f'_previous_{field_name}',None)
+    if not previous or previous == getattr(instance,field_name).name:
+        return
+
+    def delete():
+        if not is_referenced(previous):
+            delete_variants(previous)
+
+    transaction.on_commit(delete)
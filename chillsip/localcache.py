@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+from django.core.cache import cache
+from . import singleflight
+
+
+LOCAL_CACHE_SIZE = 256
+LOCAL_CACHE_CHECK_INTERVAL = 1
+
+
+class LocalCache:
+    def __init__(self,name,size=LOCAL_CACHE_SIZE,check_interval=LOCAL_CACHE_CHECK_INTERVAL):
+        self.generation_key = f'local:{name}:generation'
+        self.size = size
+        self.check_interval = check_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked = 0
+
+    def get_generation(self):
+        generation = cache.get(self.generation_key)
+        if generation is None:
+            cache.add(self.generation_key,uuid4().hex,None)
+            generation = cache.get(self.generation_key)
+        return generation
+
+    def sync(self):
+        now = time.monotonic()
+        if now - self.checked < self.check_interval:
+            return self.generation
+
+        generation = self.get_generation()
+        with self.lock:
+            if generation != self.generation:
+                self.entries.clear()
+                self.generation = generation
+            self.checked = now
+        return generation
+
+    def get_or_set(self,key,default,timeout):
+        generation = self.sync()
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+        value = singleflight.get_or_set(f'{key}:g{generation}',default,timeout)
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = value
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        cache.set(self.generation_key,uuid4().hex,None)
+        with self.lock:
+            self.entries.clear()
+            self.checked = 0
+
+
+reference_cache = LocalCache('reference')
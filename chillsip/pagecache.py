@@ -0,0 +1,84 @@
+import time
+from functools import wraps
+from hashlib import md5
+from django.conf import settings
+from django.core.cache import cache
+from .stamps import get_anonymous_stamp
+
+
+PAGE_STALE_TIMEOUT = 60 * 10
+PAGE_LOCK_TIMEOUT = 30
+PAGE_WAIT = 0.025
+PAGE_WAIT_RETRIES = 20
+
+
+def get_page_key(request):
+    partial = 'hx' if request.headers.get('HX-Request') else 'full'
+    digest = md5(f'{request.get_full_path()}:{partial}'.encode('utf-8')).hexdigest()
+    return f'page:{digest}'
+
+
+def is_cacheable(request,response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+
+
+def wait_for_page(key,version):
+    for _ in range(PAGE_WAIT_RETRIES):
+        time.sleep(PAGE_WAIT)
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version:
+            return entry
+    return None
+
+
+def cache_anonymous_page(get_request_stamp=None):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request,*args,**kwargs):
+            timeout = settings.PAGE_CACHE_TIMEOUT
+            if not timeout or request.method not in ('GET','HEAD') or request.user.is_authenticated:
+                return view(request,*args,**kwargs)
+
+            version = None
+            if get_request_stamp:
+                version = get_anonymous_stamp(request,get_request_stamp,*args,**kwargs)
+
+            key = get_page_key(request)
+            lock_key = f'{key}:lock'
+            entry = cache.get(key)
+
+            if entry is not None:
+                if entry['version'] == version and entry['fresh_until'] > time.time():
+                    return entry['response']
+                if not cache.add(lock_key,1,PAGE_LOCK_TIMEOUT):
+                    return entry['response']
+                locked = True
+            else:
+                locked = cache.add(lock_key,1,PAGE_LOCK_TIMEOUT) is not False
+                if not locked:
+                    entry = wait_for_page(key,version)
+                    if entry is not None:
+                        return entry['response']
+
+            try:
+                response = view(request,*args,**kwargs)
+                if hasattr(response,'render'):
+                    response = response.render()
+                if is_cacheable(request,response):
+                    cache.set(
+                        key,
+                        {'response':response,'version':version,'fresh_until':time.time() + timeout},
+                        timeout + PAGE_STALE_TIMEOUT,
+                    )
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+
+            return response
+        return wrapper
+    return decorator
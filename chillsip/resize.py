@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path,PurePosixPath
+from django.conf import settings
+from django.core.cache import cache
+from PIL import Image,ImageOps
+from .images import IMAGE_DIRS
+
+
+RESIZE_DIMENSIONS = {80,160,320,480,640,960,1280}
+RESIZE_WORKERS = 2
+RESIZE_LOCK_TIMEOUT = 30
+RESIZE_WAIT = 0.05
+RESIZE_RETRIES = 100
+RESIZE_BYTES_KEY = 'resize:bytes'
+RESIZE_FORMATS = {'JPEG':{'quality':85,'optimize':True,'progressive':True},'PNG':{'optimize':True},'WEBP':{'quality':80}}
+
+executor = ThreadPoolExecutor(max_workers=RESIZE_WORKERS,thread_name_prefix='resize')
+pending = {}
+pending_lock = threading.Lock()
+
+
+def clean_path(path):
+    path = PurePosixPath(path)
+    if path.is_absolute() or not path.parts or path.parts[0] not in IMAGE_DIRS or '..' in path.parts:
+        return None
+    return path
+
+
+def get_source_path(path):
+    root = Path(settings.MEDIA_ROOT).resolve()
+    source = (root / path).resolve()
+    return source if source.is_relative_to(root) and source.is_file() else None
+
+
+def get_target_path(width,height,path):
+    root = Path(settings.RESIZE_ROOT).resolve()
+    target = (root / f'{width}x{height}' / path).resolve()
+    return target if target.is_relative_to(root) else None
+
+
+def resize(source,target,width,height):
+    with Image.open(source) as image:
+        image_format = image.format if image.format in RESIZE_FORMATS else 'JPEG'
+        image.draft('RGB',(width,height))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((width,height),Image.Resampling.LANCZOS,reducing_gap=3.0)
+        if image_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        target.parent.mkdir(parents=True,exist_ok=True)
+        tmp_target = target.with_name(f'.{target.name}.{os.getpid()}.{threading.get_ident()}')
+        image.save(tmp_target,image_format,**RESIZE_FORMATS[image_format])
+        os.replace(tmp_target,target)
+
+    track_usage(target.stat().st_size)
+    return target
+
+
+def track_usage(size):
+    try:
+        total = cache.incr(RESIZE_BYTES_KEY,size)
+    except ValueError:
+        total = get_usage()
+        cache.set(RESIZE_BYTES_KEY,total,None)
+
+    if total > settings.RESIZE_CACHE_MAX_BYTES and cache.add(f'{RESIZE_BYTES_KEY}:lock',1,RESIZE_LOCK_TIMEOUT):
+        try:
+            evict(settings.RESIZE_CACHE_MAX_BYTES * 9 // 10)
+        finally:
+            cache.delete(f'{RESIZE_BYTES_KEY}:lock')
+
+
+def scan():
+    for dirpath,dirnames,filenames in os.walk(settings.RESIZE_ROOT):
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            path = Path(dirpath) / filename
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield max(stat.st_atime,stat.st_mtime),stat.st_size,path
+
+
+def get_usage():
+    return sum(size for used,size,path in scan())
+
+
+def evict(limit):
+    files = sorted(scan())
+    total = sum(size for used,size,path in files)
+
+    for used,size,path in files:
+        if total <= limit:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+    cache.set(RESIZE_BYTES_KEY,total,None)
+    return total
+
+
+def wait_for(target):
+    for _ in range(RESIZE_RETRIES):
+        time.sleep(RESIZE_WAIT)
+        if target.exists():
+            return target
+    return None
+
+
+def build(source,target,width,height):
+    lock_key = f'resize:lock:{target}'
+    if cache.add(lock_key,1,RESIZE_LOCK_TIMEOUT):
+        try:
+            return resize(source,target,width,height)
+        finally:
+            cache.delete(lock_key)
+
+    return wait_for(target) or resize(source,target,width,height)
+
+
+def get_resized(width,height,path):
+    path = clean_path(path)
+    target = path and get_target_path(width,height,path)
+    if target is None:
+        return None
+    if target.exists():
+        return target
+
+    source = get_source_path(path)
+    if source is None:
+        return None
+
+    with pending_lock:
+        future = pending.get(target)
+        if future is None:
+            future = executor.submit(build,source,target,width,height)
+            pending[target] = future
+            future.add_done_callback(lambda f: forget(target))
+
+    return future.result()
+
+
+def forget(target):
+    with pending_lock:
+        pending.pop(target,None)
@@ -16,6 +16,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'account.apps.AccountConfig',
     'shop.apps.ShopConfig',
@@ -92,6 +93,9 @@ STATICFILES_DIRS = [BASE_DIR / 'chillsip/static',]
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+PRERENDER_ROOT = MEDIA_ROOT / 'prerender'
+RESIZE_ROOT = MEDIA_ROOT / 'resize'
+RESIZE_CACHE_MAX_BYTES = 512 * 1024 * 1024
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -128,6 +132,10 @@ CACHES = {
     },
 }
 
+PAGE_CACHE_TIMEOUT = 60
+CART_HOLD_TIMEOUT = 60 * 60
+CART_ENGINE = config('CART_ENGINE',default='shop.cart')
+
 SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' 
 SESSION_CACHE_ALIAS = 'default'
 
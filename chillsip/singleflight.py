@@ -0,0 +1,130 @@
+import math
+import random
+import time
+from collections import Counter
+from uuid import uuid4
+import redis
+from django.core.cache import cache
+
+
+SINGLEFLIGHT_LOCK_TIMEOUT = 10
+SINGLEFLIGHT_STALE_TIMEOUT = 60
+SINGLEFLIGHT_WAIT = 0.025
+SINGLEFLIGHT_RETRIES = 20
+SINGLEFLIGHT_EVENTS = ('hit','miss','coalesced','refresh')
+SINGLEFLIGHT_STATS_BATCH = 100
+SINGLEFLIGHT_STATS_INTERVAL = 10
+RELEASE_SCRIPT = '''
+    if redis.call('GET',KEYS[1]) == ARGV[1] then
+        return redis.call('DEL',KEYS[1])
+    end
+    return 0
+'''
+
+
+def get_stats_key(event):
+    return f'singleflight:stats:{event}'
+
+
+class StatsBuffer:
+    def __init__(self):
+        self.pending = Counter()
+        self.flushed = time.monotonic()
+
+    def add(self,event):
+        self.pending[event] += 1
+        if sum(self.pending.values()) >= SINGLEFLIGHT_STATS_BATCH or time.monotonic() - self.flushed >= SINGLEFLIGHT_STATS_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        pending,self.pending,self.flushed = self.pending,Counter(),time.monotonic()
+        for event,delta in pending.items():
+            key = get_stats_key(event)
+            try:
+                cache.incr(key,delta)
+            except ValueError:
+                if not cache.add(key,delta,None):
+                    cache.incr(key,delta)
+
+
+stats = StatsBuffer()
+
+
+def count(event):
+    stats.add(event)
+
+
+def get_stats():
+    stats.flush()
+    values = cache.get_many([get_stats_key(event) for event in SINGLEFLIGHT_EVENTS])
+    return {event:values.get(get_stats_key(event),0) for event in SINGLEFLIGHT_EVENTS}
+
+
+def reset_stats():
+    stats.pending.clear()
+    cache.delete_many([get_stats_key(event) for event in SINGLEFLIGHT_EVENTS])
+
+
+def acquire(lock_key):
+    token = uuid4().hex
+    # None means the cache backend is unavailable, nobody else can hold the lock then
+    if cache.add(lock_key,token,SINGLEFLIGHT_LOCK_TIMEOUT) is False:
+        return None
+    return token
+
+
+def release(lock_key,token):
+    try:
+        client = cache.client.get_client(write=True)
+    except AttributeError:
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+        return
+
+    try:
+        client.eval(RELEASE_SCRIPT,1,cache.client.make_key(lock_key),cache.client.encode(token))
+    except redis.RedisError as e:
+        print(e)
+
+
+def compute(key,lock_key,token,default,timeout):
+    try:
+        started = time.time()
+        value = default()
+        delta = time.time() - started
+        cache.set(key,(value,delta,time.time() + timeout),timeout + SINGLEFLIGHT_STALE_TIMEOUT)
+        return value
+    finally:
+        release(lock_key,token)
+
+
+def get_or_set(key,default,timeout,beta=1.0):
+    key = f'singleflight:{key}'
+    lock_key = f'{key}:lock'
+    entry = cache.get(key)
+
+    if entry is not None:
+        value,delta,expires = entry
+        if time.time() - delta * beta * math.log(1 - random.random()) < expires:
+            count('hit')
+            return value
+        token = acquire(lock_key)
+        if token is None:
+            count('coalesced')
+            return value
+        count('refresh')
+        return compute(key,lock_key,token,default,timeout)
+
+    count('miss')
+    token = acquire(lock_key)
+    if token is not None:
+        return compute(key,lock_key,token,default,timeout)
+
+    for _ in range(SINGLEFLIGHT_RETRIES):
+        time.sleep(SINGLEFLIGHT_WAIT)
+        entry = cache.get(key)
+        if entry is not None:
+            count('coalesced')
+            return entry[0]
+
+    return default()
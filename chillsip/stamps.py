@@ -0,0 +1,53 @@
+import time
+from datetime import datetime,timezone
+from django.core.cache import cache
+from django.views.decorators.http import condition
+
+
+STAMP_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def get_stamp_key(name,key):
+    return f'stamp:{name}:{key}'
+
+
+def bump_stamp(name,*keys):
+    now = time.time()
+    cache.set_many({get_stamp_key(name,key):now for key in keys if key},STAMP_TIMEOUT)
+
+
+def get_stamp(name,key,compute):
+    stamp_key = get_stamp_key(name,key)
+    stamp = cache.get(stamp_key)
+
+    if stamp is None:
+        modified = compute()
+        stamp = modified.timestamp() if modified else 0
+        cache.add(stamp_key,stamp,STAMP_TIMEOUT)
+
+    return stamp or None
+
+
+def stamp_to_datetime(stamp):
+    return datetime.fromtimestamp(stamp,tz=timezone.utc) if stamp is not None else None
+
+
+def get_anonymous_stamp(request,get_request_stamp,*args,**kwargs):
+    if request.user.is_authenticated:
+        return None
+    if not hasattr(request,'_stamp'):
+        request._stamp = get_request_stamp(request,*args,**kwargs)
+    return request._stamp
+
+
+def stamp_condition(name,get_request_stamp):
+    def etag(request,*args,**kwargs):
+        stamp = get_anonymous_stamp(request,get_request_stamp,*args,**kwargs)
+        if stamp is None:
+            return None
+        return f'{name}-{stamp}-{"hx" if request.headers.get("HX-Request") else "full"}'
+
+    def last_modified(request,*args,**kwargs):
+        return stamp_to_datetime(get_anonymous_stamp(request,get_request_stamp,*args,**kwargs))
+
+    return condition(etag_func=etag,last_modified_func=last_modified)
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import time
+from pathlib import Path,PurePosixPath
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from .images import delete_variants,find_images
+
+
+GARBAGE_GRACE_PERIOD = 60 * 60
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self,*args,**kwargs):
+        kwargs.setdefault('allow_overwrite',True)
+        super().__init__(*args,**kwargs)
+
+    def get_content_name(self,name,content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+
+        path = PurePosixPath(name)
+        hexdigest = digest.hexdigest()
+        return f'{path.parts[0]}/{hexdigest[:2]}/{hexdigest[2:4]}/{hexdigest}{path.suffix.lower()}'
+
+    def _save(self,name,content):
+        name = self.get_content_name(name,content)
+        if self.exists(name):
+            os.utime(self.path(name))
+            return name
+        return super()._save(name,content)
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    return content_storage
+
+
+def find_garbage(referenced,grace=GARBAGE_GRACE_PERIOD):
+    deadline = time.time() - grace
+    for name in find_images(settings.MEDIA_ROOT):
+        if name in referenced:
+            continue
+        path = Path(settings.MEDIA_ROOT) / name
+        if path.stat().st_mtime < deadline:
+            yield name
+
+
+def delete_garbage(name):
+    content_storage.delete(name)
+    delete_variants(name)
+
+    resize_root = Path(settings.RESIZE_ROOT)
+    if resize_root.is_dir():
+        for size_dir in resize_root.iterdir():
+            (size_dir / name).unlink(missing_ok=True)
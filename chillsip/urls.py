@@ -2,9 +2,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path,include
+from .views import ImageResizeView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('media/resize/<int:width>x<int:height>/<path:path>',ImageResizeView.as_view(),name='image_resize'),
     path('api/v1/',include('rest.urls',namespace='rest')),
     path('blog/',include('blog.urls',namespace='blog')),
     path('account/',include('account.urls',namespace='account')),
@@ -0,0 +1,18 @@
+from django.http import FileResponse,Http404
+from django.utils.cache import patch_cache_control
+from django.views import View
+from .resize import RESIZE_DIMENSIONS,get_resized
+
+
+class ImageResizeView(View):
+    def get(self,request,width,height,path,*args,**kwargs):
+        if width not in RESIZE_DIMENSIONS or height not in RESIZE_DIMENSIONS:
+            raise Http404('Недопустимый размер')
+
+        target = get_resized(width,height,path)
+        if target is None:
+            raise Http404('Изображение не найдено')
+
+        response = FileResponse(open(target,'rb'))
+        patch_cache_control(response,public=True,max_age=60 * 60 * 24 * 30)
+        return response
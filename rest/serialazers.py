@@ -1,6 +1,6 @@
 from blog.models import Post
 from shop.models import Product
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import CharField,FloatField,ModelSerializer
 
 
 class PostSerializer(ModelSerializer):
@@ -11,4 +11,23 @@ class PostSerializer(ModelSerializer):
 class ProductSerializer(ModelSerializer):
     class Meta:
         model = Product
-        fields = '__all__'
\ No newline at end of file
+        exclude = ['search_vector']
+
+
+class ProductSearchSerializer(ModelSerializer):
+    rank = FloatField(read_only=True)
+    headline = CharField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id',
+            'name',
+            'slug',
+            'image',
+            'price',
+            'count',
+            'rating_average',
+            'rank',
+            'headline',
+        ]
\ No newline at end of file
@@ -1,2 +1,37 @@
 from django.test import TestCase
+from django.urls import reverse
+from shop.models import Category, Product
 
+
+class ProductSearchApiTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Напитки')
+        self.tea = Product.objects.create(
+            category=self.category,
+            name='Чёрный чай',
+            description='Классический чай',
+            price=10,
+            count=5
+        )
+        Product.objects.create(category=self.category, name='Кофе', price=10, count=5)
+        self.url = reverse('rest:product-search')
+
+    def test_search_returns_ranked_results(self):
+        response = self.client.get(self.url, {'q': 'чай'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([r['slug'] for r in results], [self.tea.slug])
+        self.assertIn('<mark>', results[0]['headline'])
+        self.assertIsNone(response.json()['next'])
+
+    def test_search_without_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_search_invalid_cursor(self):
+        response = self.client.get(self.url, {'q': 'чай', 'cursor': 'broken'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_product_detail_hides_search_vector(self):
+        response = self.client.get(reverse('rest:product-detail', args=[self.tea.id]))
+        self.assertNotIn('search_vector', response.json())
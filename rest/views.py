@@ -2,6 +2,12 @@ from django.shortcuts import render
 from .serialazers import *
 from blog.models import Post
 from shop.models import Product
+from shop.search import search_products
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.viewsets import ReadOnlyModelViewSet
 
 
@@ -11,4 +17,28 @@ class PostViewSet(ReadOnlyModelViewSet):
 
 class ProductViewSet(ReadOnlyModelViewSet):
     serializer_class = ProductSerializer
-    queryset = Product.objects.all()
+    queryset = Product.objects.defer('search_vector')
+
+    @action(detail=False)
+    def search(self,request):
+        query = request.query_params.get('q','').strip()
+        products,next_cursor = [],None
+
+        if query:
+            try:
+                products,next_cursor = search_products(
+                    query,
+                    request.query_params.get('cursor'),
+                    api_settings.PAGE_SIZE or 20,
+                )
+            except ValueError as e:
+                raise ValidationError({'cursor':str(e)})
+
+        next_url = None
+        if next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(),'cursor',next_cursor)
+
+        return Response({
+            'next':next_url,
+            'results':ProductSearchSerializer(products,many=True,context={'request':request}).data,
+        })
@@ -1,4 +1,6 @@
 from django.contrib import admin
+from django.db import models
+from chillsip.images import DownscaledImageField
 from .models import *
 
 
@@ -13,13 +15,19 @@ class ProductAdmin(admin.ModelAdmin):
         'name',
         'category',
         'count',
+        'stock_shards',
         'image',
         'description',
         'price',
+        'rating_average',
+        'rating_count',
         'created',
         'updated',
     ]
     list_filter = ['category']
+    formfield_overrides = {
+        models.ImageField:{'form_class':DownscaledImageField},
+    }
 
 @admin.register(Cart)
 class ProductInCartAdmin(admin.ModelAdmin):
@@ -0,0 +1,317 @@
+import redis
+from datetime import timedelta
+from importlib import import_module
+from uuid import uuid4
+from django.conf import settings
+from django.db import connection,transaction
+from django.utils import timezone
+from chillsip.stamps import bump_stamp
+from .catalog import bump_catalog_version,r
+from .models import Cart,Product,StockShard
+from .prerender import schedule_product_pages
+
+
+CART = Cart._meta.db_table
+PRODUCT = Product._meta.db_table
+SHARD = StockShard._meta.db_table
+STOCK_CHANGED_KEY = 'stock:changed'
+STOCK_CHANGED_BATCH_SIZE = 500
+
+
+def move_stock(source,delta,take,split=False):
+    guard = f'AND {PRODUCT}.count >= {delta}' if take else ''
+    shard_guard = f'AND s.count >= {delta}' if take else ''
+    lock = 'FOR UPDATE OF s SKIP LOCKED' if take else 'FOR UPDATE OF s'
+    stock = f'''
+    stock AS (
+        UPDATE {PRODUCT} SET count = {PRODUCT}.count - ({delta})
+        FROM {source}
+        WHERE {PRODUCT}.id = {source}.product_id AND {PRODUCT}.stock_shards = 0 {guard}
+        RETURNING {PRODUCT}.id,{PRODUCT}.count,({PRODUCT}.count = 0) <> ({PRODUCT}.count + ({delta}) = 0) AS crossed
+    )'''
+    if split:
+        return stock + f''', locked AS (
+        SELECT s.id,s.shard,s.count FROM {SHARD} s,{source}
+        WHERE s.product_id = {source}.product_id
+        ORDER BY s.shard
+        FOR UPDATE OF s
+    ), split AS (
+        SELECT id,LEAST(count,({delta}) - (running - count)) AS count
+        FROM (SELECT id,count,sum(count) OVER (ORDER BY shard) AS running FROM locked) totals
+        WHERE running - count < ({delta}) AND (SELECT sum(count) FROM locked) >= ({delta})
+    ), shard AS (
+        UPDATE {SHARD} SET count = {SHARD}.count - split.count
+        FROM split
+        WHERE {SHARD}.id = split.id
+        RETURNING {SHARD}.product_id
+    ), moved AS (
+        SELECT id AS product_id,count,false AS hot,crossed FROM stock
+        UNION ALL
+        SELECT DISTINCT shard.product_id,(SELECT sum(count) FROM locked) - ({delta}),true,false
+        FROM shard
+    )'''
+    return stock + f''', shard AS (
+        UPDATE {SHARD} SET count = {SHARD}.count - ({delta})
+        FROM {source}
+        WHERE {SHARD}.id = (
+            SELECT s.id FROM {SHARD} s,{source}
+            WHERE s.product_id = {source}.product_id {shard_guard}
+            ORDER BY random()
+            LIMIT 1
+            {lock}
+        )
+        RETURNING {SHARD}.product_id
+    ), moved AS (
+        SELECT id AS product_id,count,false AS hot,crossed FROM stock
+        UNION ALL
+        SELECT shard.product_id,(SELECT sum(s.count) FROM {SHARD} s WHERE s.product_id = shard.product_id) - ({delta}),true,false
+        FROM shard,{source}
+    )'''
+
+
+def missed_take(source,result,split):
+    if split:
+        return ''
+    return f'''
+    UNION ALL
+    SELECT NULL,NULL,NULL,NULL,true,false
+    FROM {source} JOIN {PRODUCT} p ON p.id = {source}.product_id
+    WHERE p.stock_shards > 0 AND NOT EXISTS (SELECT 1 FROM {result})'''
+
+
+def build_add_sql(split=False):
+    return f'''
+    WITH target AS (
+        SELECT %(product)s::uuid AS product_id
+    ),{move_stock('target','%(quantity)s',True,split)}, taken AS (
+        SELECT p.id,p.price,p.slug,p.category_id,moved.count,moved.hot,moved.crossed
+        FROM moved JOIN {PRODUCT} p ON p.id = moved.product_id
+    ), item AS (
+        INSERT INTO {CART} (id,user_id,product_id,price,count,created,updated)
+        SELECT %(id)s,%(user)s,taken.id,taken.price,%(quantity)s,%(now)s,%(now)s
+        FROM taken
+        ON CONFLICT (user_id,product_id) DO UPDATE
+        SET count = {CART}.count + EXCLUDED.count,updated = EXCLUDED.updated
+        RETURNING count
+    )
+    SELECT item.count,taken.count,taken.slug,taken.category_id,taken.hot,taken.crossed
+    FROM item,taken{missed_take('target','taken',split)}
+'''
+
+
+def build_increment_sql(split=False):
+    return f'''
+    WITH item AS (
+        SELECT id,product_id FROM {CART}
+        WHERE id = %(id)s AND user_id = %(user)s
+        FOR UPDATE
+    ),{move_stock('item','1',True,split)}, changed AS (
+        UPDATE {CART} SET count = {CART}.count + 1,updated = %(now)s
+        FROM item,moved JOIN {PRODUCT} p ON p.id = moved.product_id
+        WHERE {CART}.id = item.id
+        RETURNING {CART}.count,moved.count AS stock,p.slug,p.category_id,moved.hot,moved.crossed
+    )
+    SELECT * FROM changed{missed_take('item','changed',split)}
+'''
+
+
+ADD_SQL = build_add_sql()
+ADD_SPLIT_SQL = build_add_sql(True)
+INCREMENT_SQL = build_increment_sql()
+INCREMENT_SPLIT_SQL = build_increment_sql(True)
+
+DECREMENT_SQL = f'''
+    WITH item AS (
+        UPDATE {CART} SET count = count - 1,updated = %(now)s
+        WHERE id = %(id)s AND user_id = %(user)s AND count > 1
+        RETURNING product_id,count
+    ),{move_stock('item','-1',False)}
+    SELECT item.count,moved.count,p.slug,p.category_id,moved.hot,moved.crossed
+    FROM item,moved JOIN {PRODUCT} p ON p.id = moved.product_id
+'''
+
+DELETE_SQL = f'''
+    WITH item AS (
+        DELETE FROM {CART}
+        WHERE id = %(id)s AND user_id = %(user)s
+        RETURNING product_id,count
+    ),{move_stock('item','-item.count',False)}
+    SELECT 0,moved.count,p.slug,p.category_id,moved.hot,moved.crossed
+    FROM moved JOIN {PRODUCT} p ON p.id = moved.product_id
+'''
+
+RELEASE_SQL = f'''
+    WITH expired AS (
+        SELECT id FROM {CART}
+        WHERE updated < %(deadline)s
+        ORDER BY updated
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    ), removed AS (
+        DELETE FROM {CART}
+        USING expired
+        WHERE {CART}.id = expired.id
+        RETURNING {CART}.product_id,{CART}.user_id,{CART}.count
+    ), released AS (
+        SELECT product_id,sum(count) AS count,array_agg(user_id ORDER BY user_id) AS users,array_agg(count ORDER BY user_id) AS counts
+        FROM removed
+        GROUP BY product_id
+    ), restocked AS (
+        UPDATE {PRODUCT} SET count = {PRODUCT}.count + released.count
+        FROM released
+        WHERE {PRODUCT}.id = released.product_id AND {PRODUCT}.stock_shards = 0
+        RETURNING {PRODUCT}.id
+    ), resharded AS (
+        UPDATE {SHARD} SET count = {SHARD}.count + released.count
+        FROM released
+        WHERE {SHARD}.product_id = released.product_id AND {SHARD}.shard = 0
+        RETURNING {SHARD}.product_id
+    )
+    SELECT p.id,p.slug,p.category_id,released.count,released.users,released.counts
+    FROM released JOIN {PRODUCT} p ON p.id = released.product_id
+'''
+
+RECONCILE_SQL = f'''
+    WITH totals AS (
+        SELECT product_id,sum(count) AS count
+        FROM {SHARD}
+        GROUP BY product_id
+    )
+    UPDATE {PRODUCT} SET count = totals.count
+    FROM totals
+    WHERE {PRODUCT}.id = totals.product_id AND {PRODUCT}.stock_shards > 0 AND {PRODUCT}.count <> totals.count
+    RETURNING {PRODUCT}.slug,{PRODUCT}.category_id
+'''
+RELEASE_BATCH_SIZE = 500
+
+
+def mutate(sql,fallback=None,**params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql,params)
+        row = cursor.fetchone()
+        if row is not None and row[0] is None and fallback:
+            cursor.execute(fallback,params)
+            row = cursor.fetchone()
+
+    if row is None or row[0] is None:
+        return None
+
+    cart_count,product_count,slug,category_id,hot,crossed = row
+    if crossed:
+        bump_catalog_version(category_id)
+        bump_stamp('product',slug)
+    if not hot:
+        mark_stock_changed(slug)
+    return cart_count,product_count
+
+
+def mark_stock_changed(slug):
+    try:
+        r.sadd(STOCK_CHANGED_KEY,slug)
+    except redis.RedisError as e:
+        print(e)
+
+
+def flush_stock_changes(batch_size=STOCK_CHANGED_BATCH_SIZE):
+    flushed = 0
+    while slugs := r.spop(STOCK_CHANGED_KEY,batch_size):
+        products = Product.objects.filter(slug__in=[slug.decode('utf-8') for slug in slugs]).values_list('slug','category_id')
+        if products:
+            touch_products(*zip(*products))
+        flushed += len(slugs)
+    return flushed
+
+
+def touch_products(slugs,category_ids):
+    bump_catalog_version(*set(category_ids))
+    bump_stamp('product',*slugs)
+    schedule_product_pages(list(slugs))
+
+
+def add_product(user,product_id,quantity=1):
+    return mutate(ADD_SQL,ADD_SPLIT_SQL,id=uuid4(),user=user.pk,product=product_id,quantity=quantity,now=timezone.now())
+
+
+def increment_item(user,item_id):
+    return mutate(INCREMENT_SQL,INCREMENT_SPLIT_SQL,id=item_id,user=user.pk,now=timezone.now())
+
+
+def decrement_item(user,item_id):
+    return mutate(DECREMENT_SQL,id=item_id,user=user.pk,now=timezone.now())
+
+
+def delete_item(user,item_id):
+    return mutate(DELETE_SQL,id=item_id,user=user.pk)
+
+
+# Cart rows are written on every click, so there is nothing to persist or forget here.
+def persist_cart(user):
+    pass
+
+
+def forget_cart(user,items):
+    pass
+
+
+def persist_carts():
+    return 0
+
+
+def release_batches(batch_size=RELEASE_BATCH_SIZE):
+    deadline = timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT)
+
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(RELEASE_SQL,{'deadline':deadline,'limit':batch_size})
+            rows = cursor.fetchall()
+
+        if not rows:
+            return
+
+        touch_products([row[1] for row in rows],[row[2] for row in rows])
+        yield rows
+
+
+def release_expired_holds(batch_size=RELEASE_BATCH_SIZE):
+    return sum(row[3] for rows in release_batches(batch_size) for row in rows)
+
+
+def shard_stock(product_id,shards,total=None):
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product_id)
+        current = {shard.shard:shard for shard in StockShard.objects.select_for_update().filter(product=product)}
+        if total is None:
+            total = sum(shard.count for shard in current.values()) if product.stock_shards else product.count
+
+        base,extra = divmod(total,shards or 1)
+        changed,created = [],[]
+        for number in range(shards):
+            count = base + (number < extra)
+            shard = current.pop(number,None)
+            if shard is None:
+                created.append(StockShard(product=product,shard=number,count=count))
+            elif shard.count != count:
+                shard.count = count
+                changed.append(shard)
+
+        StockShard.objects.filter(pk__in=[shard.pk for shard in current.values()]).delete()
+        StockShard.objects.bulk_update(changed,['count'])
+        StockShard.objects.bulk_create(created)
+        Product.objects.filter(pk=product.pk).update(stock_shards=shards,count=total)
+
+    touch_products([product.slug],[product.category_id])
+    return total
+
+
+def reconcile_stock_shards():
+    with connection.cursor() as cursor:
+        cursor.execute(RECONCILE_SQL)
+        rows = cursor.fetchall()
+
+    if rows:
+        touch_products([slug for slug,category_id in rows],[category_id for slug,category_id in rows])
+    return len(rows)
+
+
+def get_cart_engine():
+    return import_module(settings.CART_ENGINE)
@@ -0,0 +1,254 @@
+import redis
+from base64 import urlsafe_b64decode,urlsafe_b64encode
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count,Max,Q
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from chillsip.localcache import reference_cache
+from chillsip.stamps import bump_stamp,get_stamp
+from .models import Category,Product,Street
+
+
+r = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    db=settings.REDIS_DB
+)
+
+CATALOG_TIMEOUT = 60 * 60
+CARD_TIMEOUT = 60 * 60 * 24
+CARD_TEMPLATE_VERSION = 3
+REVIEWS_PAGE_SIZE = 3
+IMAGE_POOL_KEY = 'product:with_image'
+
+PRICE_RANGES = (
+    ('0-100','до 100₽',Q(price__lt=100)),
+    ('100-200','100–200₽',Q(price__gte=100,price__lt=200)),
+    ('200-300','200–300₽',Q(price__gte=200,price__lt=300)),
+    ('300-500','300–500₽',Q(price__gte=300,price__lt=500)),
+    ('500-','от 500₽',Q(price__gte=500)),
+)
+RATING_LEVELS = (
+    ('3','от 3 звезд',Q(rating_stars__gte=3)),
+    ('4','от 4 звезд',Q(rating_stars__gte=4)),
+    ('4.5','от 4.5 звезд',Q(rating_stars__gte=Decimal('4.5'))),
+)
+IN_STOCK = Q(count__gt=0)
+
+
+class CatalogPage:
+    def __init__(self,object_list,number=None,num_pages=None,next_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.num_pages = num_pages
+        self.next_cursor = next_cursor
+
+    @classmethod
+    def from_page(cls,page_obj):
+        object_list = list(page_obj.object_list)
+        next_cursor = encode_cursor(object_list[-1]) if page_obj.has_next() else None
+        return cls(object_list,page_obj.number,page_obj.paginator.num_pages,next_cursor)
+
+    @classmethod
+    def from_cursor(cls,queryset,cursor,page_size):
+        queryset = queryset.order_by('-created','id')
+
+        if cursor:
+            created,id = decode_cursor(cursor,queryset.model._meta.pk.to_python)
+            queryset = queryset.filter(created__lte=created).exclude(created=created,id__lte=id)
+
+        object_list = list(queryset[:page_size + 1])
+        next_cursor = None
+
+        if len(object_list) > page_size:
+            object_list = object_list[:page_size]
+            next_cursor = encode_cursor(object_list[-1])
+
+        return cls(object_list,next_cursor=next_cursor)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def is_paginated(self):
+        if self.number is None:
+            return True
+        return self.num_pages > 1
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def next_page_number(self):
+        return self.number + 1
+
+
+def encode_cursor(product):
+    value = f'{product.created.isoformat()}|{product.id}'
+    return urlsafe_b64encode(value.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor,to_id=UUID):
+    try:
+        value = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created,id = value.split('|')
+        return datetime.fromisoformat(created),to_id(id)
+    except (ValueError,UnicodeDecodeError,ValidationError) as e:
+        raise ValueError('Некорректный курсор') from e
+
+
+def get_version_key(category_id=None):
+    return f'catalog:version:{category_id or "all"}'
+
+
+def get_catalog_version(category_id=None):
+    return cache.get(get_version_key(category_id)) or 0
+
+
+def bump_catalog_version(*category_ids):
+    keys = {get_version_key()} | {get_version_key(id) for id in category_ids if id}
+
+    for key in keys:
+        cache.add(key,0,None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key,1,None)
+
+    bump_stamp('catalog','all',*category_ids)
+
+
+def get_catalog_stamp(category_id=None):
+    products = Product.objects.filter(category_id=category_id) if category_id else Product.objects.all()
+    return get_stamp(
+        'catalog',
+        category_id or 'all',
+        lambda: products.aggregate(updated=Max('updated'))['updated'],
+    )
+
+
+def get_product_stamp(slug):
+    def compute():
+        modified = Product.objects.filter(slug=slug).aggregate(
+            updated=Max('updated'),
+            feedback=Max('feedback__created'),
+        )
+        return max(filter(None,modified.values()),default=None)
+
+    return get_stamp('product',slug,compute)
+
+
+def get_category(slug):
+    return reference_cache.get_or_set(
+        f'category:{slug}',
+        lambda: get_object_or_404(Category,slug=slug),
+        60 * 60 * 24,
+    )
+
+
+def get_categories():
+    return reference_cache.get_or_set(
+        'category_all',
+        lambda: list(Category.objects.all()),
+        60 * 60 * 24,
+    )
+
+
+def get_streets():
+    return reference_cache.get_or_set(
+        'street_all',
+        lambda: list(Street.objects.all()),
+        60 * 60 * 24,
+    )
+
+
+def get_page_key(category,page,partial,filter_query=''):
+    category_id = category.id if category else None
+    version = get_catalog_version(category_id)
+    return f'catalog:{category_id or "all"}:v{version}:p{page}:{"hx" if partial else "full"}:{filter_query}'
+
+
+def get_facet_counts(category):
+    category_id = category.id if category else None
+    cache_key = f'catalog:facets:{category_id or "all"}:v{get_catalog_version(category_id)}'
+    counts = cache.get(cache_key)
+
+    if counts is None:
+        queryset = Product.objects.filter(category=category) if category else Product.objects.all()
+        facets = {
+            **{f'price:{value}':condition for value,_,condition in PRICE_RANGES},
+            **{f'rating:{value}':condition for value,_,condition in RATING_LEVELS},
+            'in_stock':IN_STOCK,
+        }
+        aliases = {f'facet_{i}':name for i,name in enumerate(facets)}
+        result = queryset.aggregate(**{
+            alias:Count('pk',filter=facets[name]) for alias,name in aliases.items()
+        })
+        counts = {name:result[alias] for alias,name in aliases.items()}
+        cache.set(cache_key,counts,CATALOG_TIMEOUT)
+
+    return counts
+
+
+
+def rebuild_image_pool():
+    ids = [str(id) for id in Product.objects.exclude(image__isnull=True).exclude(image='')
+           .values_list('id',flat=True).iterator()]
+    pipe = r.pipeline()
+    pipe.delete(IMAGE_POOL_KEY)
+    for i in range(0,len(ids),1000):
+        pipe.sadd(IMAGE_POOL_KEY,*ids[i:i + 1000])
+    pipe.execute()
+    return len(ids)
+
+
+def update_image_pool(product,deleted=False):
+    if product.image and not deleted:
+        r.sadd(IMAGE_POOL_KEY,str(product.id))
+    else:
+        r.srem(IMAGE_POOL_KEY,str(product.id))
+
+
+def get_random_products(count=20):
+    if not r.exists(IMAGE_POOL_KEY):
+        rebuild_image_pool()
+
+    ids = [id.decode('utf-8') for id in r.srandmember(IMAGE_POOL_KEY,count)]
+    if not ids:
+        return []
+
+    products = list(Product.objects.filter(id__in=ids))
+    products.sort(key=lambda x: ids.index(str(x.id)))
+    return products
+
+
+def get_card_key(product):
+    return (
+        f'product_card:v{CARD_TEMPLATE_VERSION}:{product.id}:{product.updated.timestamp()}'
+        f':{product.count}:{product.rating_stars}'
+    )
+
+
+def render_product_cards(products):
+    products = list(products)
+    keys = [get_card_key(product) for product in products]
+    cards = cache.get_many(keys)
+    missing = {}
+
+    for key,product in zip(keys,products):
+        if key not in cards:
+            missing[key] = render_to_string('shop/product_card.html',{'product':product})
+
+    if missing:
+        cache.set_many(missing,CARD_TIMEOUT)
+        cards.update(missing)
+
+    return mark_safe('\n'.join(cards[key] for key in keys))
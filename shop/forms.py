@@ -1,4 +1,7 @@
 from django import forms
+from django.db.models import Q
+from django.utils.http import urlencode
+from .catalog import IN_STOCK,PRICE_RANGES,RATING_LEVELS,get_streets
 from .models import Order,Feedback
 
 class OrderForm(forms.ModelForm):
@@ -10,6 +13,12 @@ class OrderForm(forms.ModelForm):
             'building',
             'apartment'
         ]
+
+    def __init__(self,*args,**kwargs):
+        super().__init__(*args,**kwargs)
+        field = self.fields['street']
+        field.choices = [('',field.empty_label)] + [(street.pk,street.name) for street in get_streets()]
+
     def clean(self):
         cleaned_data = super().clean()
         is_private = cleaned_data.get('is_private')
@@ -39,4 +48,61 @@ class FeedbackForm(forms.ModelForm):
         ]
         widgets = {
             'rating': forms.RadioSelect(choices=CHOICES)
-        }
\ No newline at end of file
+        }
+
+
+class ProductFilterForm(forms.Form):
+    price = forms.ChoiceField(
+        choices=[('','любая')] + [(value,label) for value,label,_ in PRICE_RANGES],
+        required=False,
+        label='Цена',
+    )
+    rating = forms.ChoiceField(
+        choices=[('','любой')] + [(value,label) for value,label,_ in RATING_LEVELS],
+        required=False,
+        label='Рейтинг',
+    )
+    in_stock = forms.BooleanField(
+        required=False,
+        label='В наличии',
+    )
+
+    def get_params(self):
+        self.is_valid()
+        params = {}
+        for name in ('price','rating'):
+            if self.cleaned_data.get(name):
+                params[name] = self.cleaned_data[name]
+        if self.cleaned_data.get('in_stock'):
+            params['in_stock'] = 1
+        return params
+
+    def get_query_string(self):
+        return urlencode(self.get_params())
+
+    def get_condition(self):
+        params = self.get_params()
+        condition = Q()
+
+        if 'price' in params:
+            condition &= {value:q for value,_,q in PRICE_RANGES}[params['price']]
+        if 'rating' in params:
+            condition &= {value:q for value,_,q in RATING_LEVELS}[params['rating']]
+        if 'in_stock' in params:
+            condition &= IN_STOCK
+
+        return condition
+
+    def get_facets(self,counts):
+        params = self.get_params()
+        return {
+            'price':[
+                {'value':value,'label':label,'count':counts[f'price:{value}'],'selected':params.get('price') == value}
+                for value,label,_ in PRICE_RANGES
+            ],
+            'rating':[
+                {'value':value,'label':label,'count':counts[f'rating:{value}'],'selected':params.get('rating') == value}
+                for value,label,_ in RATING_LEVELS
+            ],
+            'in_stock':{'count':counts['in_stock'],'selected':'in_stock' in params},
+        }
@@ -0,0 +1,48 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from blog.models import Post
+from chillsip.images import get_image_meta
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Вычисляет размеры и превью для загруженных изображений'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--workers',type=int,default=os.cpu_count(),help='Количество процессов')
+        parser.add_argument('--force',action='store_true',help='Пересчитать существующие превью')
+
+    def handle(self,*args,**options):
+        targets = [(Product,'image'),(Post,'image'),(get_user_model(),'foto')]
+        total = 0
+
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork'),
+        ) as executor:
+            for model,field_name in targets:
+                queryset = model.objects.exclude(**{f'{field_name}__isnull':True}).exclude(**{field_name:''})
+                if not options['force']:
+                    queryset = queryset.filter(**{f'{field_name}_placeholder':''})
+
+                rows = list(queryset.values_list('pk',field_name))
+                objects = []
+                for (pk,name),meta in zip(rows,executor.map(get_image_meta,[name for pk,name in rows],chunksize=8)):
+                    if meta is None:
+                        continue
+                    obj = model(pk=pk)
+                    for suffix,value in zip(('width','height','placeholder'),meta):
+                        setattr(obj,f'{field_name}_{suffix}',value)
+                    objects.append(obj)
+
+                model.objects.bulk_update(
+                    objects,
+                    [f'{field_name}_width',f'{field_name}_height',f'{field_name}_placeholder'],
+                    batch_size=500,
+                )
+                total += len(objects)
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено {total} изображений'))
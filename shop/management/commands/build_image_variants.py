@@ -0,0 +1,80 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from blog.models import Post
+from chillsip.images import find_images,generate_variants,has_variants
+from shop.models import Product
+
+
+def build_variants(name):
+    generate_variants(name)
+    return has_variants(name)
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии и WebP для загруженных изображений'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--workers',type=int,default=os.cpu_count(),help='Количество процессов')
+        parser.add_argument('--force',action='store_true',help='Пересоздать существующие копии')
+        parser.add_argument('--pending',action='store_true',help='Обработать только записи, у которых копии еще не отмечены')
+        parser.add_argument('--interval',type=int,default=0,help='Повторять обработку каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self,*args,**options):
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('fork'),
+        ) as executor:
+            if not options['pending']:
+                names = list(find_images(settings.MEDIA_ROOT))
+                build = partial(generate_variants,force=options['force'])
+                created = sum(executor.map(build,names,chunksize=8))
+
+                self.stdout.write(self.style.SUCCESS(f'Обработано {len(names)} изображений, создано {created} копий'))
+                return
+
+            failed = set()
+            while True:
+                count = self.build_pending(executor,failed)
+                if count or not options['interval']:
+                    self.stdout.write(self.style.SUCCESS(f'Готовы копии для {count} изображений'))
+                if not options['interval']:
+                    return
+                time.sleep(options['interval'])
+
+    def build_pending(self,executor,failed):
+        targets = [(Product,'image'),(Post,'image'),(get_user_model(),'foto')]
+        pending = []
+        for model,field_name in targets:
+            rows = (
+                model.objects.exclude(**{f'{field_name}__isnull':True}).exclude(**{field_name:''})
+                .filter(**{f'{field_name}_variants':False}).values_list('pk',field_name)
+            )
+            pending += [(model,field_name,pk,name) for pk,name in rows if (model,pk,name) not in failed]
+        if not pending:
+            return 0
+
+        names = list({name for *_,name in pending})
+        ready = dict(zip(names,executor.map(build_variants,names,chunksize=8)))
+
+        total = 0
+        for model,field_name,pk,name in pending:
+            if not ready[name]:
+                failed.add((model,pk,name))
+                continue
+
+            with transaction.atomic():
+                obj = model.objects.select_for_update().filter(pk=pk,**{field_name:name}).first()
+                if obj is None:
+                    continue
+                setattr(obj,f'{field_name}_variants',True)
+                obj.save(update_fields=[f'{field_name}_variants'])
+            total += 1
+
+        return total
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from chillsip.singleflight import get_stats,reset_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает счетчики попаданий, промахов и ожиданий кеша'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--reset',action='store_true',help='Обнулить счетчики')
+
+    def handle(self,*args,**options):
+        for event,value in get_stats().items():
+            self.stdout.write(f'{event}: {value}')
+
+        if options['reset']:
+            reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счетчики обнулены'))
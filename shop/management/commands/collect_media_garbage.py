@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from blog.models import Post
+from chillsip.storage import GARBAGE_GRACE_PERIOD,delete_garbage,find_garbage
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Удаляет загруженные изображения, на которые не ссылаются товары, посты и пользователи'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--grace',type=int,default=GARBAGE_GRACE_PERIOD,help='Не трогать файлы моложе указанного числа секунд')
+        parser.add_argument('--dry-run',action='store_true',help='Только показать файлы, ничего не удалять')
+
+    def handle(self,*args,**options):
+        referenced = set()
+        for model,field_name in ((Product,'image'),(Post,'image'),(get_user_model(),'foto')):
+            referenced.update(
+                model.objects.exclude(**{field_name:''}).exclude(**{f'{field_name}__isnull':True})
+                .values_list(field_name,flat=True)
+            )
+
+        garbage = list(find_garbage(referenced,options['grace']))
+        for name in garbage:
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                delete_garbage(name)
+
+        action = 'Найдено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{action} {len(garbage)} неиспользуемых файлов'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand,CommandError
+from shop import cart
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Включает или выключает режим горячего товара с остатком, разбитым на шарды'
+
+    def add_arguments(self,parser):
+        parser.add_argument('slug',help='Slug товара')
+        parser.add_argument('--shards',type=int,default=8,help='Количество шардов (0 - выключить режим)')
+
+    def handle(self,*args,**options):
+        if cart.get_cart_engine() is not cart:
+            raise CommandError('Режим горячего товара работает только с корзиной в базе данных')
+        if not 0 <= options['shards'] <= 64:
+            raise CommandError('Количество шардов должно быть от 0 до 64')
+
+        product_id = Product.objects.filter(slug=options['slug']).values_list('id',flat=True).first()
+        if product_id is None:
+            raise CommandError(f'Товар {options["slug"]} не найден')
+
+        total = cart.shard_stock(product_id,options['shards'])
+        if options['shards']:
+            self.stdout.write(self.style.SUCCESS(f'Остаток {total} разбит на {options["shards"]} шардов'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Режим горячего товара выключен, остаток {total}'))
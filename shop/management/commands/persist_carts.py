@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.cart import get_cart_engine
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет корзины и резервы товаров из Redis в базу данных'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--interval',type=int,default=0,help='Повторять каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self,*args,**options):
+        while True:
+            persisted = get_cart_engine().persist_carts()
+            self.stdout.write(self.style.SUCCESS(f'Сохранено корзин: {persisted}'))
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
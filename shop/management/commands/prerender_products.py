@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.cart import flush_stock_changes
+from shop.models import Product
+from shop.prerender import render_queued_pages,write_product_page
+
+
+class Command(BaseCommand):
+    help = 'Сохраняет страницы товаров в статический HTML для nginx'
+
+    def add_arguments(self,parser):
+        parser.add_argument('slugs',nargs='*',help='Slug товаров, по умолчанию все')
+        parser.add_argument('--queue',action='store_true',help='Обработать только товары из очереди на обновление и изменения остатков')
+        parser.add_argument('--interval',type=int,default=0,help='Повторять обработку очереди каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self,*args,**options):
+        if not options['queue']:
+            slugs = options['slugs'] or Product.objects.values_list('slug',flat=True).iterator()
+            count = sum(write_product_page(slug) for slug in slugs)
+            self.stdout.write(self.style.SUCCESS(f'Сохранено {count} страниц товаров'))
+            return
+
+        while True:
+            flush_stock_changes()
+            count = render_queued_pages()
+            if count or not options['interval']:
+                self.stdout.write(self.style.SUCCESS(f'Сохранено {count} страниц товаров'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
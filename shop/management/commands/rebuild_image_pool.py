@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.catalog import rebuild_image_pool
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает пул товаров с изображениями для карусели'
+
+    def handle(self,*args,**options):
+        count = rebuild_image_pool()
+        self.stdout.write(self.style.SUCCESS(f'В пул добавлено {count} товаров'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает средний рейтинг, количество оценок и звезды для всех товаров'
+
+    def handle(self,*args,**options):
+        updated = Product.objects.all().refresh_rating()
+        self.stdout.write(self.style.SUCCESS(f'Рейтинг пересчитан для {updated} товаров'))
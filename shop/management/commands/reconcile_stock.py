@@ -0,0 +1,19 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.cart import reconcile_stock_shards
+
+
+class Command(BaseCommand):
+    help = 'Сверяет количество горячих товаров с суммой шардов остатка'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--interval',type=int,default=0,help='Повторять каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self,*args,**options):
+        while True:
+            reconciled = reconcile_stock_shards()
+            self.stdout.write(self.style.SUCCESS(f'Обновлено товаров: {reconciled}'))
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
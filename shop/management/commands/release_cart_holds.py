@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from shop.cart import RELEASE_BATCH_SIZE,get_cart_engine
+
+
+class Command(BaseCommand):
+    help = 'Возвращает на склад товары из корзин с истекшей бронью'
+
+    def add_arguments(self,parser):
+        parser.add_argument('--batch-size',type=int,default=RELEASE_BATCH_SIZE,help='Количество позиций корзины за один запрос')
+        parser.add_argument('--interval',type=int,default=0,help='Повторять каждые N секунд (0 - выполнить один раз)')
+
+    def handle(self,*args,**options):
+        while True:
+            released = get_cart_engine().release_expired_holds(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Возвращено на склад {released} шт.'))
+
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.2 on 2026-10-18 06:29
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Round
+
+
+def fill_rating(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Feedback = apps.get_model('shop', 'Feedback')
+    feedback = Feedback.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    average = Coalesce(
+        Subquery(feedback.annotate(avg=models.Avg('rating')).values('avg')),
+        Value(0),
+        output_field=models.DecimalField(),
+    )
+    count = Coalesce(
+        Subquery(feedback.annotate(count=models.Count('id')).values('count')),
+        Value(0),
+    )
+    Product.objects.update(
+        rating_average=average,
+        rating_count=count,
+        rating_stars=Round(average * 2) / 2,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_alter_order_street'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=3, verbose_name='Средний рейтинг'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество оценок'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_stars',
+            field=models.DecimalField(decimal_places=1, default=0, editable=False, max_digits=2, verbose_name='Звезды'),
+        ),
+        migrations.RunPython(fill_rating, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.2 on 2026-10-18 07:30
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_review_count(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Feedback = apps.get_model('shop', 'Feedback')
+    reviews = (
+        Feedback.objects.filter(product=OuterRef('pk'), review__isnull=False)
+        .exclude(review='')
+        .order_by()
+        .values('product')
+    )
+    Product.objects.update(
+        review_count=Coalesce(
+            Subquery(reviews.annotate(count=models.Count('id')).values('count')),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0021_product_facet_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(condition=models.Q(('review__isnull', False), models.Q(('review', ''), _negated=True)), fields=['product', '-created', 'id'], name='shop_feedback_review_idx'),
+        ),
+        migrations.RunPython(fill_review_count, migrations.RunPython.noop),
+    ]
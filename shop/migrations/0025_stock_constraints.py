@@ -0,0 +1,31 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def clamp_counts(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Cart = apps.get_model('shop', 'Cart')
+    Product.objects.filter(count__lt=0).update(count=0)
+    Cart.objects.filter(count__lt=1).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0024_product_image_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(clamp_counts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.CheckConstraint(condition=models.Q(('count__gte', 1)), name='shop_cart_count_gte_1'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(condition=models.Q(('count__gte', 0)), name='shop_product_count_gte_0'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:14
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0026_cart_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Для горячих товаров остаток хранится в шардах, а количество периодически сверяется', verbose_name='Шарды остатка'),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, verbose_name='UUID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Номер шарда')),
+                ('count', models.IntegerField(default=0, verbose_name='Количество')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Шард остатка',
+                'verbose_name_plural': 'Шарды остатка',
+                'ordering': ['product', 'shard'],
+                'constraints': [models.UniqueConstraint(fields=('product', 'shard'), name='shop_stockshard_product_shard'), models.CheckConstraint(condition=models.Q(('count__gte', 0)), name='shop_stockshard_count_gte_0')],
+            },
+        ),
+    ]
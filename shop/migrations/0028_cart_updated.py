@@ -0,0 +1,50 @@
+# Generated by Django 5.2.2 on 2026-10-18 08:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    Cart = apps.get_model('shop', 'Cart')
+    Cart.objects.update(updated=F('created'))
+
+    duplicates = (
+        Cart.objects.values('user', 'product')
+        .annotate(rows=Count('id'), total=Sum('count'))
+        .filter(rows__gt=1)
+    )
+    for duplicate in duplicates:
+        items = Cart.objects.filter(user=duplicate['user'], product=duplicate['product']).order_by('created')
+        kept = items.first()
+        items.exclude(pk=kept.pk).delete()
+        Cart.objects.filter(pk=kept.pk).update(count=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0027_stock_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cart',
+            name='shop_cart_created_15e0bd_idx',
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Изменен'),
+        ),
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated'], name='shop_cart_updated_b1769a_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='shop_cart_user_product_unique'),
+        ),
+    ]
@@ -1,9 +1,14 @@
-from decimal import ROUND_HALF_UP, Decimal
+from decimal import Decimal
 from uuid import uuid4
 from autoslug import AutoSlugField
 from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex,OpClass
+from django.contrib.postgres.search import SearchVector,SearchVectorField
 from django.db import models
+from django.db.models import OuterRef,Q,Subquery,Value
+from django.db.models.functions import Coalesce,Lower,Replace,Round
 from django.urls import reverse
+from chillsip.storage import get_content_storage
 from django.core.validators import MinValueValidator,MaxValueValidator
 
 
@@ -68,6 +73,34 @@ class Category(models.Model):
         return reverse('shop:product_list_by_category',args=[self.slug])
 
 
+HAS_REVIEW = Q(review__isnull=False) & ~Q(review='')
+
+
+class ProductQuerySet(models.QuerySet):
+
+    def refresh_rating(self):
+        feedback = Feedback.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        average = Coalesce(
+            Subquery(feedback.annotate(avg=models.Avg('rating')).values('avg')),
+            Value(0),
+            output_field=models.DecimalField(),
+        )
+        count = Coalesce(
+            Subquery(feedback.annotate(count=models.Count('id')).values('count')),
+            Value(0),
+        )
+        review_count = Coalesce(
+            Subquery(feedback.filter(HAS_REVIEW).annotate(count=models.Count('id')).values('count')),
+            Value(0),
+        )
+        return self.update(
+            rating_average=average,
+            rating_count=count,
+            rating_stars=Round(average * 2) / 2,
+            review_count=review_count,
+        )
+
+
 class Product(models.Model):
 
     id = models.UUIDField(
@@ -94,10 +127,34 @@ class Product(models.Model):
     )
     image = models.ImageField(
         upload_to='products/%Y/%m/%d',
+        storage=get_content_storage,
         blank=True,
         null=True,
         verbose_name='Изображение',
     )
+    image_width = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Ширина изображения',
+    )
+    image_height = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name='Высота изображения',
+    )
+    image_placeholder = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Превью изображения',
+    )
+    image_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Копии изображения созданы',
+    )
     description = models.TextField(
         blank=True,
         verbose_name='Описание'
@@ -112,6 +169,12 @@ class Product(models.Model):
         validators=[MinValueValidator(0)],
         verbose_name='Количество',
     )
+    stock_shards = models.PositiveSmallIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Шарды остатка',
+        help_text='Для горячих товаров остаток хранится в шардах, а количество периодически сверяется',
+    )
     created = models.DateTimeField(
         auto_now_add=True,
         verbose_name='Создан',
@@ -120,12 +183,62 @@ class Product(models.Model):
         auto_now=True,
         verbose_name='Изменен',
     )
+    rating_average = models.DecimalField(
+        max_digits=3,
+        decimal_places=2,
+        default=0,
+        editable=False,
+        verbose_name='Средний рейтинг',
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество оценок',
+    )
+    rating_stars = models.DecimalField(
+        max_digits=2,
+        decimal_places=1,
+        default=0,
+        editable=False,
+        verbose_name='Звезды',
+    )
+    review_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество отзывов',
+    )
+
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector('name',weight='A',config='russian')
+            + SearchVector('description',weight='B',config='russian')
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+        verbose_name='Поисковый вектор',
+    )
+
+    objects = ProductQuerySet.as_manager()
+
+    RATING_FIELDS = ['rating_average','rating_count','rating_stars','review_count']
 
     class Meta:
         ordering = ['-created']
         indexes = [
             models.Index(fields=['name']),
-            models.Index(fields=['-created']),
+            models.Index(fields=['-created','id']),
+            models.Index(fields=['category','-created','id']),
+            models.Index(fields=['category','price']),
+            models.Index(fields=['price']),
+            models.Index(fields=['rating_stars']),
+            GinIndex(fields=['search_vector']),
+            GinIndex(
+                OpClass(Replace(Lower('name'),Value('ё'),Value('е')),name='gin_trgm_ops'),
+                name='shop_product_name_trgm',
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(count__gte=0),name='shop_product_count_gte_0'),
         ]
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
@@ -137,10 +250,8 @@ class Product(models.Model):
         return reverse('shop:product_detail',args=[self.slug])
     
     def get_average_rating_url(self):
-        average = self.feedback.aggregate(avg=models.Avg('rating'))['avg'] or 0
-        rounded = (Decimal(average) * 2).quantize(Decimal('1'), rounding=ROUND_HALF_UP) / 2
-        return f'images/rating/{rounded}.png'
-    
+        return f'images/rating/{Decimal(self.rating_stars).normalize()}.png'
+
     
 class Cart(models.Model):
 
@@ -177,9 +288,20 @@ class Cart(models.Model):
         auto_now_add=True,
         verbose_name='Создан',
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Изменен',
+    )
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['updated']),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(count__gte=1),name='shop_cart_count_gte_1'),
+            models.UniqueConstraint(fields=['user','product'],name='shop_cart_user_product_unique'),
+        ]
         verbose_name = 'Товар в корзине'
         verbose_name_plural = 'Товары в корзине'
 
@@ -188,7 +310,42 @@ class Cart(models.Model):
 
     def get_cost(self):
         return (self.price * self.count)
-    
+
+
+class StockShard(models.Model):
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid4,
+        editable=False,
+        verbose_name='UUID',
+    )
+    product = models.ForeignKey(
+        Product,
+        related_name='shards',
+        on_delete=models.CASCADE,
+        verbose_name='Товар',
+    )
+    shard = models.PositiveSmallIntegerField(
+        verbose_name='Номер шарда',
+    )
+    count = models.IntegerField(
+        default=0,
+        verbose_name='Количество',
+    )
+
+    class Meta:
+        ordering = ['product','shard']
+        constraints = [
+            models.UniqueConstraint(fields=['product','shard'],name='shop_stockshard_product_shard'),
+            models.CheckConstraint(condition=Q(count__gte=0),name='shop_stockshard_count_gte_0'),
+        ]
+        verbose_name = 'Шард остатка'
+        verbose_name_plural = 'Шарды остатка'
+
+    def __str__(self):
+        return f'{self.product} #{self.shard}'
+
 
 class Order(models.Model):
 
@@ -326,6 +483,13 @@ class Feedback(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['product','-created','id'],
+                condition=HAS_REVIEW,
+                name='shop_feedback_review_idx',
+            ),
+        ]
         verbose_name = 'Обратная связь'
         verbose_name_plural = 'Обратная связь'
 
@@ -0,0 +1,86 @@
+import os
+import redis
+from pathlib import Path
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import Http404,HttpRequest
+from django.urls import reverse
+from .catalog import r
+
+
+PRERENDER_QUEUE_KEY = 'prerender:queue'
+PRERENDER_BATCH_SIZE = 100
+
+
+def get_snapshot_path(slug):
+    url = reverse('shop:product_detail',args=[slug])
+    return Path(settings.PRERENDER_ROOT) / url.strip('/') / 'index.html'
+
+
+def render_product_html(slug):
+    from .views import ProductDetailView
+
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = reverse('shop:product_detail',args=[slug])
+    request.user = AnonymousUser()
+
+    view = ProductDetailView()
+    view.setup(request,slug=slug)
+    return view.get(request,slug=slug).render().content
+
+
+def remove_product_page(slug):
+    if slug:
+        get_snapshot_path(slug).unlink(missing_ok=True)
+
+
+def write_product_page(slug):
+    path = get_snapshot_path(slug)
+    try:
+        html = render_product_html(slug)
+    except Http404:
+        remove_product_page(slug)
+        return False
+
+    path.parent.mkdir(parents=True,exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}')
+    tmp_path.write_bytes(html)
+    os.replace(tmp_path,path)
+    return True
+
+
+def queue_product_pages(slugs):
+    try:
+        r.sadd(PRERENDER_QUEUE_KEY,*slugs)
+    except redis.RedisError as e:
+        print(e)
+        for slug in slugs:
+            write_product_page(slug)
+
+
+def schedule_product_pages(slugs,removed=()):
+    slugs = [slug for slug in slugs if slug]
+
+    def refresh():
+        try:
+            for slug in removed:
+                remove_product_page(slug)
+            if slugs:
+                queue_product_pages(slugs)
+        except OSError as e:
+            print(e)
+
+    transaction.on_commit(refresh)
+
+
+def render_queued_pages(batch_size=PRERENDER_BATCH_SIZE):
+    rendered = 0
+    while slugs := r.spop(PRERENDER_QUEUE_KEY,batch_size):
+        for slug in slugs:
+            try:
+                rendered += write_product_page(slug.decode('utf-8'))
+            except OSError as e:
+                print(e)
+    return rendered
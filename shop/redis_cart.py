@@ -0,0 +1,351 @@
+import time
+from decimal import Decimal
+from uuid import UUID,uuid4
+from django.conf import settings
+from django.db import DatabaseError,IntegrityError,connection,transaction
+from django.utils import timezone
+from . import cart
+from .catalog import r
+from .models import Cart,Product
+
+
+PENDING_KEY = 'cart:pending_stock'
+QUARANTINE_KEY = 'cart:quarantined_stock'
+DIRTY_KEY = 'cart:dirty'
+APPLY_LOCK_KEY = 'cart:applying'
+APPLY_LOCK_TIMEOUT = 60
+GENERATION_KEY = 'cart:stock_generation'
+LOAD_STOCK_ATTEMPTS = 10
+PERSIST_BATCH_SIZE = 100
+NOT_LOADED = -2
+NO_STOCK = -1
+
+RESERVE_SCRIPT = r.register_script('''
+    if redis.call('EXISTS',KEYS[1]) == 0 then
+        return -2
+    end
+    local stock = redis.call('GET',KEYS[2])
+    if not stock then
+        return -1
+    end
+
+    local product,delta,mode = ARGV[1],tonumber(ARGV[2]),ARGV[3]
+    local count = tonumber(redis.call('HGET',KEYS[1],'count:' .. product) or '0')
+    if mode ~= 'add' and count == 0 then
+        return false
+    end
+    if mode == 'delete' then
+        delta = -count
+    elseif count + delta < 1 or (delta > 0 and tonumber(stock) < delta) then
+        return false
+    end
+
+    stock = redis.call('DECRBY',KEYS[2],delta)
+    redis.call('HINCRBY',KEYS[3],product,delta)
+    redis.call('SADD',KEYS[4],ARGV[4])
+    redis.call('HINCRBY',KEYS[1],'version',1)
+    redis.call('EXPIRE',KEYS[1],ARGV[7])
+
+    if mode == 'delete' then
+        local item = redis.call('HGET',KEYS[1],'id:' .. product)
+        redis.call('HDEL',KEYS[1],'count:' .. product,'price:' .. product,'id:' .. product,'item:' .. item)
+        return {0,stock}
+    end
+    if count == 0 then
+        redis.call('HSET',KEYS[1],'price:' .. product,ARGV[6],'id:' .. product,ARGV[5],'item:' .. ARGV[5],product)
+    end
+    return {redis.call('HINCRBY',KEYS[1],'count:' .. product,delta),stock}
+''')
+
+LOAD_SCRIPT = r.register_script('''
+    if redis.call('EXISTS',KEYS[1]) == 0 then
+        redis.call('HSET',KEYS[1],unpack(ARGV,2))
+        redis.call('EXPIRE',KEYS[1],ARGV[1])
+    end
+''')
+
+LOAD_STOCK_SCRIPT = r.register_script('''
+    if redis.call('EXISTS',KEYS[3]) == 1 or (redis.call('GET',KEYS[4]) or '0') ~= ARGV[2] then
+        return 0
+    end
+    local pending = tonumber(redis.call('HGET',KEYS[2],ARGV[3]) or '0')
+    local quarantined = tonumber(redis.call('HGET',KEYS[5],ARGV[3]) or '0')
+    redis.call('SET',KEYS[1],tonumber(ARGV[1]) - pending - quarantined,'NX')
+    return 1
+''')
+
+PERSISTED_SCRIPT = r.register_script('''
+    if redis.call('EXISTS',KEYS[1]) == 1 then
+        redis.call('HSET',KEYS[1],'persisted',ARGV[1])
+    end
+''')
+
+DROP_SCRIPT = r.register_script('''
+    if redis.call('EXISTS',KEYS[1]) == 0 then
+        return 0
+    end
+    for i = 2,#ARGV,2 do
+        local product,stock = ARGV[i],KEYS[3 + i / 2]
+        local left = redis.call('HINCRBY',KEYS[1],'count:' .. product,-tonumber(ARGV[i + 1]))
+        if left < 0 then
+            redis.call('HINCRBY',KEYS[2],product,-left)
+            if redis.call('EXISTS',stock) == 1 then
+                redis.call('DECRBY',stock,-left)
+            end
+        end
+        if left <= 0 then
+            local item = redis.call('HGET',KEYS[1],'id:' .. product)
+            redis.call('HDEL',KEYS[1],'count:' .. product,'price:' .. product,'id:' .. product)
+            if item then
+                redis.call('HDEL',KEYS[1],'item:' .. item)
+            end
+        end
+    end
+    redis.call('HINCRBY',KEYS[1],'version',1)
+    redis.call('SADD',KEYS[3],ARGV[1])
+    return 1
+''')
+
+UNLOCK_SCRIPT = r.register_script('''
+    redis.call('INCR',KEYS[2])
+    if redis.call('GET',KEYS[1]) == ARGV[1] then
+        redis.call('DEL',KEYS[1])
+    end
+''')
+
+TAKE_SCRIPT = r.register_script('''
+    local values = redis.call('HGETALL',KEYS[1])
+    redis.call('DEL',KEYS[1])
+    return values
+''')
+
+APPLY_SQL = f'''
+    UPDATE {cart.PRODUCT} SET count = {cart.PRODUCT}.count - pending.delta
+    FROM (VALUES {{values}}) AS pending(id,delta)
+    WHERE {cart.PRODUCT}.id = pending.id
+    RETURNING {cart.PRODUCT}.slug,{cart.PRODUCT}.category_id
+'''
+
+
+def get_cart_key(user_id):
+    return f'cart:{user_id}'
+
+
+def get_stock_key(product_id):
+    return f'stock:{product_id}'
+
+
+def load_cart(user_id):
+    fields = [settings.CART_HOLD_TIMEOUT,'loaded',1,'version',0,'persisted',0]
+    for id,product_id,count,price in Cart.objects.filter(user_id=user_id).values_list('id','product_id','count','price'):
+        fields += [
+            f'count:{product_id}',count,
+            f'price:{product_id}',str(price),
+            f'id:{product_id}',str(id),
+            f'item:{id}',str(product_id),
+        ]
+    LOAD_SCRIPT(keys=[get_cart_key(user_id)],args=fields,client=r)
+
+
+def load_stock(product_id):
+    keys = [get_stock_key(product_id),PENDING_KEY,APPLY_LOCK_KEY,GENERATION_KEY,QUARANTINE_KEY]
+    for _ in range(LOAD_STOCK_ATTEMPTS):
+        generation = (r.get(GENERATION_KEY) or b'0').decode('utf-8')
+        count = Product.objects.filter(pk=product_id).values_list('count',flat=True).first()
+        if count is None:
+            return False
+        if LOAD_STOCK_SCRIPT(keys=keys,args=[count,generation,str(product_id)],client=r):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def forget_stock(*product_ids):
+    if product_ids:
+        r.delete(*[get_stock_key(product_id) for product_id in product_ids])
+
+
+def reserve(user_id,product_id,delta,mode,price=''):
+    keys = [get_cart_key(user_id),get_stock_key(product_id),PENDING_KEY,DIRTY_KEY]
+    args = [str(product_id),delta,mode,str(user_id),str(uuid4()),price,settings.CART_HOLD_TIMEOUT]
+
+    for _ in range(3):
+        result = RESERVE_SCRIPT(keys=keys,args=args,client=r)
+        if result == NOT_LOADED:
+            load_cart(user_id)
+        elif result == NO_STOCK:
+            if not load_stock(product_id):
+                return None
+        else:
+            return tuple(result) if result else None
+    return None
+
+
+def get_item_product(user_id,item_id):
+    key = get_cart_key(user_id)
+    if not r.exists(key):
+        load_cart(user_id)
+
+    product_id = r.hget(key,f'item:{item_id}')
+    return product_id.decode('utf-8') if product_id else None
+
+
+def change_item(user,item_id,delta,mode):
+    product_id = get_item_product(user.pk,item_id)
+    if product_id is None:
+        return None
+    return reserve(user.pk,product_id,delta,mode)
+
+
+def add_product(user,product_id,quantity=1):
+    price = Product.objects.filter(pk=product_id).values_list('price',flat=True).first()
+    if price is None:
+        return None
+    return reserve(user.pk,product_id,quantity,'add',str(price))
+
+
+def increment_item(user,item_id):
+    return change_item(user,item_id,1,'increment')
+
+
+def decrement_item(user,item_id):
+    return change_item(user,item_id,-1,'decrement')
+
+
+def delete_item(user,item_id):
+    return change_item(user,item_id,0,'delete')
+
+
+def read_cart(user_id):
+    data = {key.decode('utf-8'):value.decode('utf-8') for key,value in r.hgetall(get_cart_key(user_id)).items()}
+    return data.get('version'),{
+        field.removeprefix('count:'):(UUID(data[f'id:{field[6:]}']),int(count),Decimal(data[f'price:{field[6:]}']))
+        for field,count in data.items()
+        if field.startswith('count:')
+    }
+
+
+def save_cart(user_id):
+    key = get_cart_key(user_id)
+    if not r.exists(key):
+        return
+
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {item.id:item for item in Cart.objects.select_for_update().filter(user_id=user_id)}
+        version,items = read_cart(user_id)
+        if version is None:
+            return
+        Cart.objects.filter(user_id=user_id).exclude(id__in=[id for id,count,price in items.values()]).delete()
+
+        changed,created = [],[]
+        for product_id,(id,count,price) in items.items():
+            item = existing.get(id)
+            if item is None:
+                created.append(Cart(id=id,user_id=user_id,product_id=product_id,count=count,price=price))
+            elif item.count != count:
+                item.count = count
+                item.updated = now
+                changed.append(item)
+
+        Cart.objects.bulk_update(changed,['count','updated'])
+        Cart.objects.bulk_create(created)
+
+    PERSISTED_SCRIPT(keys=[key],args=[version],client=r)
+
+
+def apply_pending_stock():
+    token = str(uuid4())
+    if not r.set(APPLY_LOCK_KEY,token,nx=True,ex=APPLY_LOCK_TIMEOUT):
+        return 0
+    try:
+        return apply_stock_deltas()
+    finally:
+        UNLOCK_SCRIPT(keys=[APPLY_LOCK_KEY,GENERATION_KEY],args=[token],client=r)
+
+
+def apply_stock_deltas():
+    values = TAKE_SCRIPT(keys=[PENDING_KEY],client=r)
+    deltas = {
+        UUID(product_id.decode('utf-8')):int(delta)
+        for product_id,delta in zip(values[::2],values[1::2])
+        if int(delta)
+    }
+    if not deltas:
+        return 0
+
+    remaining = dict(deltas)
+    try:
+        try:
+            rows = update_stock(deltas)
+        except IntegrityError:
+            rows = []
+            for product_id,delta in deltas.items():
+                try:
+                    rows += update_stock({product_id:delta})
+                except IntegrityError as e:
+                    print(e)
+                    r.hincrby(QUARANTINE_KEY,str(product_id),delta)
+                del remaining[product_id]
+    except DatabaseError:
+        for product_id,delta in remaining.items():
+            r.hincrby(PENDING_KEY,str(product_id),delta)
+        raise
+
+    cart.touch_products([slug for slug,category_id in rows],[category_id for slug,category_id in rows])
+    return len(rows)
+
+
+def update_stock(deltas):
+    params = [value for item in deltas.items() for value in item]
+    with transaction.atomic(),connection.cursor() as cursor:
+        cursor.execute(APPLY_SQL.format(values=','.join(['(%s::uuid,%s::integer)'] * len(deltas))),params)
+        return cursor.fetchall()
+
+
+def persist_carts(batch_size=PERSIST_BATCH_SIZE):
+    apply_pending_stock()
+
+    persisted = 0
+    while user_ids := r.spop(DIRTY_KEY,batch_size):
+        for user_id in user_ids:
+            save_cart(user_id.decode('utf-8'))
+        persisted += len(user_ids)
+    return persisted
+
+
+def persist_cart(user):
+    r.srem(DIRTY_KEY,str(user.pk))
+    save_cart(user.pk)
+
+
+def drop_items(user_id,items):
+    keys = [get_cart_key(user_id),PENDING_KEY,DIRTY_KEY] + [get_stock_key(product_id) for product_id,count in items]
+    args = [str(user_id)] + [value for product_id,count in items for value in (str(product_id),count)]
+    return DROP_SCRIPT(keys=keys,args=args,client=r)
+
+
+def forget_cart(user,items):
+    drop_items(user.pk,items)
+
+
+def release_expired_holds(batch_size=cart.RELEASE_BATCH_SIZE):
+    persist_carts()
+
+    released = 0
+    batches = cart.release_batches(batch_size)
+    while True:
+        with transaction.atomic():
+            rows = next(batches,None)
+            if rows is None:
+                return released
+
+            items = {}
+            for product_id,slug,category_id,count,users,counts in rows:
+                for user_id,user_count in zip(users,counts):
+                    items.setdefault(user_id,[]).append((product_id,user_count))
+            for user_id,user_items in items.items():
+                drop_items(user_id,user_items)
+
+        forget_stock(*[row[0] for row in rows])
+        released += sum(row[3] for row in rows)
@@ -0,0 +1,115 @@
+from base64 import urlsafe_b64decode,urlsafe_b64encode
+from hashlib import md5
+from uuid import UUID
+from django.contrib.postgres.search import SearchHeadline,SearchQuery,SearchRank,TrigramWordSimilarity
+from django.core.cache import cache
+from django.db.models import F,FloatField,Q,Value
+from django.db.models.functions import Cast,Lower,Replace
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from .models import Product
+
+
+SEARCH_CONFIG = 'russian'
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_STOP = '\x03'
+AUTOCOMPLETE_MIN_LENGTH = 2
+AUTOCOMPLETE_TIMEOUT = 60
+
+
+def fold_name(expression):
+    return Replace(Lower(expression),Value('ё'),Value('е'))
+
+
+def fold_query(query):
+    return ' '.join(query.lower().replace('ё','е').split())
+
+
+def encode_search_cursor(product):
+    value = f'{product.rank!r}|{product.id}'
+    return urlsafe_b64encode(value.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        value = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        rank,id = value.split('|')
+        return float(rank),UUID(id)
+    except (ValueError,UnicodeDecodeError) as e:
+        raise ValueError('Некорректный курсор') from e
+
+
+def highlight(text):
+    return mark_safe(
+        escape(text)
+        .replace(HIGHLIGHT_START,'<mark>')
+        .replace(HIGHLIGHT_STOP,'</mark>')
+    )
+
+
+def search_products(query,cursor=None,limit=8):
+    search_query = SearchQuery(query,config=SEARCH_CONFIG,search_type='websearch')
+    queryset = (
+        Product.objects.filter(search_vector=search_query)
+        .annotate(rank=Cast(SearchRank(F('search_vector'),search_query),FloatField()))
+        .defer('search_vector')
+    )
+
+    if cursor:
+        rank,id = decode_search_cursor(cursor)
+        queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank,id__gt=id))
+
+    products = list(
+        queryset.order_by('-rank','id')
+        .annotate(
+            headline=SearchHeadline(
+                'description',
+                search_query,
+                config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START,
+                stop_sel=HIGHLIGHT_STOP,
+                max_words=30,
+                min_words=10,
+            ),
+            name_headline=SearchHeadline(
+                'name',
+                search_query,
+                config=SEARCH_CONFIG,
+                start_sel=HIGHLIGHT_START,
+                stop_sel=HIGHLIGHT_STOP,
+                highlight_all=True,
+            ),
+        )[:limit + 1]
+    )
+    next_cursor = None
+
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = encode_search_cursor(products[-1])
+
+    for product in products:
+        product.headline = highlight(product.headline)
+        product.name_headline = highlight(product.name_headline)
+
+    return products,next_cursor
+
+
+def autocomplete_products(query,limit=8):
+    query = fold_query(query)
+    if len(query) < AUTOCOMPLETE_MIN_LENGTH:
+        return []
+
+    cache_key = f'autocomplete:{limit}:{md5(query.encode("utf-8")).hexdigest()}'
+    results = cache.get(cache_key)
+
+    if results is None:
+        results = list(
+            Product.objects.annotate(folded_name=fold_name('name'))
+            .filter(Q(folded_name__contains=query) | Q(folded_name__trigram_word_similar=query))
+            .annotate(similarity=TrigramWordSimilarity(query,'folded_name'))
+            .order_by('-similarity','name')
+            .values('name','slug')[:limit]
+        )
+        cache.set(cache_key,results,AUTOCOMPLETE_TIMEOUT)
+
+    return results
@@ -0,0 +1,129 @@
+import redis
+from django.db.models.signals import post_delete,post_save,pre_save
+from django.dispatch import receiver
+from chillsip.images import delete_replaced_variants,fill_image_meta,remember_image
+from chillsip.localcache import reference_cache
+from chillsip.stamps import bump_stamp
+from . import redis_cart
+from .cart import get_cart_engine,shard_stock
+from .catalog import bump_catalog_version,update_image_pool
+from .models import Category,Feedback,Product,Street
+from .prerender import schedule_product_pages
+
+
+@receiver(post_save,sender=Category)
+@receiver(post_delete,sender=Category)
+@receiver(post_save,sender=Street)
+@receiver(post_delete,sender=Street)
+def invalidate_reference_cache(sender,instance,**kwargs):
+    reference_cache.invalidate()
+
+    if sender is Category:
+        bump_catalog_version(instance.id)
+
+
+@receiver(post_save,sender=Category)
+def prerender_category_products(sender,instance,created=False,**kwargs):
+    if not created:
+        schedule_product_pages(list(instance.products.values_list('slug',flat=True)))
+
+
+@receiver(pre_save,sender=Product)
+def remember_product_state(sender,instance,update_fields=None,**kwargs):
+    instance._previous_category_id = instance._previous_slug = instance._previous_count = None
+
+    if instance._state.adding or (update_fields and not {'category','name','slug','count'} & set(update_fields)):
+        return
+
+    instance._previous_category_id,instance._previous_slug,instance._previous_count = (
+        Product.objects.filter(pk=instance.pk).values_list('category_id','slug','count').first() or (None,None,None)
+    )
+
+
+@receiver(post_save,sender=Product)
+@receiver(post_delete,sender=Product)
+def invalidate_catalog(sender,instance,**kwargs):
+    bump_catalog_version(instance.category_id,getattr(instance,'_previous_category_id',None))
+
+
+@receiver(post_save,sender=Product)
+@receiver(post_delete,sender=Product)
+def touch_product_page(sender,instance,**kwargs):
+    bump_stamp('product',instance.slug,getattr(instance,'_previous_slug',None))
+
+
+@receiver(post_save,sender=Product)
+@receiver(post_delete,sender=Product)
+def prerender_product_page(sender,instance,signal,**kwargs):
+    previous_slug = getattr(instance,'_previous_slug',None)
+
+    if signal is post_delete:
+        schedule_product_pages([],removed=[instance.slug])
+    else:
+        schedule_product_pages([instance.slug],removed=[previous_slug] if previous_slug != instance.slug else [])
+
+
+@receiver(pre_save,sender=Product)
+def fill_product_image_meta(sender,instance,update_fields=None,**kwargs):
+    fill_image_meta(instance,'image',update_fields)
+
+
+@receiver(pre_save,sender=Product)
+def remember_product_image(sender,instance,update_fields=None,**kwargs):
+    remember_image(instance,'image',update_fields)
+
+
+@receiver(post_save,sender=Product)
+def delete_replaced_product_image_variants(sender,instance,**kwargs):
+    delete_replaced_variants(instance,'image')
+
+
+@receiver(post_save,sender=Product)
+@receiver(post_delete,sender=Product)
+def sync_image_pool(sender,instance,signal,**kwargs):
+    try:
+        update_image_pool(instance,deleted=signal is post_delete)
+    except redis.RedisError as e:
+        print(e)
+
+
+@receiver(post_save,sender=Product)
+def reshard_product_stock(sender,instance,created=False,**kwargs):
+    previous_count = getattr(instance,'_previous_count',None)
+    if instance.stock_shards and previous_count is not None and previous_count != instance.count:
+        shard_stock(instance.pk,instance.stock_shards,instance.count)
+
+
+@receiver(post_save,sender=Product)
+@receiver(post_delete,sender=Product)
+def reset_stock_counter(sender,instance,update_fields=None,**kwargs):
+    if get_cart_engine() is not redis_cart or (update_fields and 'count' not in update_fields):
+        return
+
+    try:
+        redis_cart.forget_stock(instance.id)
+    except redis.RedisError as e:
+        print(e)
+
+
+@receiver(post_save,sender=Feedback)
+@receiver(post_delete,sender=Feedback)
+def touch_feedback_product_page(sender,instance,**kwargs):
+    slug = Product.objects.filter(pk=instance.product_id).values_list('slug',flat=True).first()
+    bump_stamp('product',slug)
+    if slug:
+        schedule_product_pages([slug])
+
+
+@receiver(post_save,sender=Feedback)
+@receiver(post_delete,sender=Feedback)
+def update_product_rating(sender,instance,signal,update_fields=None,**kwargs):
+    if update_fields and not {'rating','review'} & set(update_fields):
+        return
+
+    product = Product.objects.filter(pk=instance.product_id)
+    product.refresh_rating()
+    bump_catalog_version(product.values_list('category_id',flat=True).first())
+
+    if signal is post_save and Feedback.product.is_cached(instance):
+        instance.product.refresh_from_db(fields=Product.RATING_FIELDS)
@@ -0,0 +1,40 @@
+const search_input = document.querySelector('.search__input');
+const search_suggestions = document.querySelector('#searchSuggestions');
+
+if (search_input && search_suggestions) {
+    let timer = null;
+    const suggestions_cache = {};
+
+    const render = (results) => {
+        search_suggestions.innerHTML = '';
+        results.forEach(item => {
+            const option = document.createElement('option');
+            option.value = item.name;
+            search_suggestions.appendChild(option);
+        });
+    };
+
+    search_input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const query = search_input.value.trim().toLowerCase();
+
+        if (query.length < 2) {
+            render([]);
+            return;
+        }
+
+        timer = setTimeout(() => {
+            if (suggestions_cache[query]) {
+                render(suggestions_cache[query]);
+                return;
+            }
+            fetch(`${search_input.dataset.url}?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    suggestions_cache[query] = data.results;
+                    render(data.results);
+                })
+                .catch(() => render([]));
+        }, 200);
+    });
+}
@@ -0,0 +1,35 @@
+from django import template
+from django.core.files.storage import default_storage
+from chillsip.images import VARIANT_FORMATS,get_variant_name,get_variant_widths
+from shop.catalog import render_product_cards
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_cards(products):
+    return render_product_cards(products)
+
+
+@register.inclusion_tag('shop/picture.html')
+def picture(image,default,class_name='',sizes='100vw'):
+    context = {'default':default,'class_name':class_name,'sizes':sizes}
+
+    if image:
+        context['src'] = image.url
+        for suffix in ('width','height','placeholder'):
+            context[suffix] = getattr(image.instance,f'{image.field.name}_{suffix}',None)
+        if getattr(image.instance,f'{image.field.name}_variants',False):
+            widths = get_variant_widths(context['width'])
+            context['sources'] = [
+                (
+                    content_type,
+                    ', '.join(
+                        f'{default_storage.url(get_variant_name(image.name,variant,ext))} {width}w'
+                        for variant,width in widths
+                    ),
+                )
+                for ext,image_format,content_type,options in VARIANT_FORMATS
+            ]
+    return context
@@ -1,19 +1,75 @@
-from unittest import mock
+import redis
+from unittest import SkipTest, mock
 from unittest.mock import patch
-from uuid import uuid4
+from uuid import UUID, uuid4
 from django.forms import ValidationError
-from django.test import Client, TestCase
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from shop.forms import OrderForm
-from shop.models import Street, Category, Product, Cart, Order, ProductInOrder, Feedback
+from shop.search import autocomplete_products, search_products
+from shop.catalog import IMAGE_POOL_KEY, get_facet_counts, get_random_products, rebuild_image_pool, render_product_cards
+from django.template.loader import render_to_string
+from shop.models import Street, Category, Product, Cart, Order, ProductInOrder, Feedback, StockShard
 from django.urls import reverse
 from decimal import Decimal
-from django.db import IntegrityError
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from datetime import timedelta
+from django.test.utils import CaptureQueriesContext
 from django.utils.http import urlencode
+from django.core.management import call_command
+from chillsip import singleflight
+from chillsip.localcache import LocalCache, reference_cache
+from shop.catalog import get_catalog_version, get_categories, get_category, get_product_stamp, get_streets
+from chillsip.pagecache import get_page_key
+from django.test import RequestFactory
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+from chillsip.images import find_images, generate_variants, get_variant_name, get_variant_names
+from chillsip.storage import GARBAGE_GRACE_PERIOD, content_storage
+from chillsip import resize
+import os
+import threading
+import time
+from shop.prerender import PRERENDER_QUEUE_KEY, get_snapshot_path, render_queued_pages
+from shop.cart import STOCK_CHANGED_KEY, add_product, flush_stock_changes, reconcile_stock_shards, release_expired_holds, shard_stock
+from shop import redis_cart
 
 
 User = get_user_model()
 
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+TEST_REDIS_DB = 15
+
+
+class TestRedisMixin:
+    redis_targets = ('shop.catalog.r', 'shop.cart.r', 'shop.prerender.r', 'shop.redis_cart.r')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.redis = redis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=TEST_REDIS_DB)
+        try:
+            cls.redis.ping()
+        except redis.ConnectionError:
+            raise SkipTest('Redis недоступен')
+        super().setUpClass()
+
+    def setUp(self):
+        self.redis.flushdb()
+        self.addCleanup(self.redis.flushdb)
+        for target in self.redis_targets:
+            redis_patch = patch(target, self.redis)
+            redis_patch.start()
+            self.addCleanup(redis_patch.stop)
+
 
 class StreetModelTest(TestCase):
     def setUp(self):
@@ -283,7 +339,68 @@ class FeedbackModelTest(TestCase):
         self.assertEqual(feedback.rating, 3)
 
 
+class ProductRatingSummaryTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rating_user', password='testpass',email='rating@example.com')
+        self.category = Category.objects.create(name='Чай')
+        self.product = Product.objects.create(
+            category=self.category,
+            name='Улун',
+            price=Decimal('300.00'),
+            count=10
+        )
+
+    def test_rating_updated_on_feedback_create(self):
+        Feedback.objects.create(user=self.user, product=self.product, rating=5)
+        Feedback.objects.create(user=self.user, product=self.product, rating=4)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_average, Decimal('4.50'))
+        self.assertEqual(self.product.rating_stars, Decimal('4.5'))
+
+    def test_rating_updated_on_feedback_change(self):
+        feedback = Feedback.objects.create(user=self.user, product=self.product, rating=1)
+        feedback.rating = 4
+        feedback.save()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 1)
+        self.assertEqual(self.product.get_average_rating_url(), 'images/rating/4.png')
+
+    def test_rating_updated_on_feedback_delete(self):
+        feedback = Feedback.objects.create(user=self.user, product=self.product, rating=3)
+        feedback.delete()
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 0)
+        self.assertEqual(self.product.get_average_rating_url(), 'images/rating/0.png')
+
+    def test_get_average_rating_url_without_query(self):
+        Feedback.objects.create(user=self.user, product=self.product, rating=2)
+        product = Product.objects.get(pk=self.product.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_average_rating_url(), 'images/rating/2.png')
+
+    def test_rebuild_ratings_command(self):
+        Feedback.objects.create(user=self.user, product=self.product, rating=3)
+        Feedback.objects.create(user=self.user, product=self.product, rating=4)
+        Product.objects.update(rating_average=0, rating_count=0, rating_stars=0)
+
+        out = StringIO()
+        call_command('rebuild_ratings', stdout=out)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.rating_count, 2)
+        self.assertEqual(self.product.rating_average, Decimal('3.50'))
+        self.assertEqual(self.product.rating_stars, Decimal('3.5'))
+
+
 class AboutTemplateViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
     def test_about_page_status_code(self):
         response = self.client.get(reverse('shop:about'))
         self.assertEqual(response.status_code, 200)
@@ -311,6 +428,9 @@ class ProductListViewTests(TestCase):
                 count=5
             )
 
+    def setUp(self):
+        cache.clear()
+
     def test_product_list_status_code(self):
         response = self.client.get(reverse('shop:product_list'))
         self.assertEqual(response.status_code, 200)
@@ -340,6 +460,1044 @@ class ProductListViewTests(TestCase):
         self.assertEqual(len(response.context['products']), 8)  
 
 
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Кофе')
+        self.other_category = Category.objects.create(name='Соки')
+        for i in range(10):
+            Product.objects.create(
+                category=self.category,
+                name=f'Кофе {i}',
+                price=10,
+                count=5
+            )
+        self.url = reverse('shop:product_list_by_category', args=[self.category.slug])
+
+    def test_warm_page_costs_no_queries(self):
+        self.client.get(self.url)
+        cache.delete(get_page_key(RequestFactory().get(self.url)))
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['products']), 8)
+        self.assertTrue(response.context['is_paginated'])
+
+    def test_partial_and_full_pages_cached_separately(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'shop/product_partial.html')
+
+    def test_product_save_invalidates_category_pages(self):
+        self.client.get(self.url)
+        self.client.get(reverse('shop:product_list'))
+        product = Product.objects.create(category=self.category, name='Новинка', price=10, count=1)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['products'][0], product)
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertEqual(response.context['products'][0], product)
+
+    def test_product_move_invalidates_previous_category(self):
+        self.client.get(self.url)
+        product = Product.objects.filter(category=self.category).first()
+        product.category = self.other_category
+        product.save()
+
+        response = self.client.get(self.url)
+        self.assertNotIn(product, response.context['products'])
+
+    def test_product_save_keeps_other_category_cached(self):
+        other_url = reverse('shop:product_list_by_category', args=[self.other_category.slug])
+        self.client.get(other_url)
+        Product.objects.create(category=self.category, name='Новинка', price=10, count=1)
+
+        with self.assertNumQueries(0):
+            self.client.get(other_url)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListCursorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Чай')
+        self.products = [
+            Product.objects.create(category=self.category, name=f'Чай {i}', price=10, count=5)
+            for i in range(20)
+        ]
+        Product.objects.filter(pk__in=[p.pk for p in self.products[:6]]).update(created=self.products[0].created)
+        self.url = reverse('shop:product_list')
+
+    def test_page_mode_exposes_next_cursor(self):
+        response = self.client.get(self.url)
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertIsNotNone(page_obj.next_cursor)
+        self.assertContains(response, f'?cursor={page_obj.next_cursor}')
+
+    def test_cursor_walks_whole_catalog_without_duplicates(self):
+        response = self.client.get(self.url)
+        seen = [p.pk for p in response.context['products']]
+        cursor = response.context['page_obj'].next_cursor
+
+        while cursor:
+            response = self.client.get(self.url, {'cursor': cursor}, HTTP_HX_REQUEST='true')
+            seen += [p.pk for p in response.context['products']]
+            cursor = response.context['page_obj'].next_cursor
+
+        expected = list(Product.objects.order_by('-created', 'id').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_page_skips_count(self):
+        cursor = self.client.get(self.url).context['page_obj'].next_cursor
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'cursor': cursor}, HTTP_HX_REQUEST='true')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(self.url, {'cursor': 'broken'}, HTTP_HX_REQUEST='true')
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_mode_still_available(self):
+        response = self.client.get(self.url, {'page': 2})
+        self.assertEqual(response.context['page_obj'].number, 2)
+        self.assertEqual(len(response.context['products']), 8)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Напитки')
+        self.green_tea = Product.objects.create(
+            category=self.category,
+            name='Зелёный чай',
+            description='Ароматный чай с жасмином',
+            price=10,
+            count=5
+        )
+        self.coffee = Product.objects.create(
+            category=self.category,
+            name='Кофе',
+            description='Крепкий кофе & сливки, хорошо сочетается с чаем',
+            price=10,
+            count=5
+        )
+        self.juice = Product.objects.create(
+            category=self.category,
+            name='Апельсиновый сок',
+            description='Свежевыжатый',
+            price=10,
+            count=5
+        )
+        self.url = reverse('shop:product_search')
+
+    def test_search_uses_russian_stemming(self):
+        products, next_cursor = search_products('чаи')
+        self.assertEqual(products, [self.green_tea, self.coffee])
+        self.assertIsNone(next_cursor)
+
+    def test_name_matches_rank_higher(self):
+        products, _ = search_products('чай')
+        self.assertEqual(products[0], self.green_tea)
+        self.assertGreater(products[0].rank, products[1].rank)
+
+    def test_headline_is_highlighted_and_escaped(self):
+        products, _ = search_products('кофе')
+        self.assertIn('<mark>кофе</mark>', products[0].headline)
+        self.assertIn('&amp;', products[0].headline)
+
+    def test_search_cursor_pagination(self):
+        first, cursor = search_products('чай', limit=1)
+        second, next_cursor = search_products('чай', cursor=cursor, limit=1)
+        self.assertEqual(first + second, [self.green_tea, self.coffee])
+        self.assertIsNone(next_cursor)
+
+    def test_search_view(self):
+        response = self.client.get(self.url, {'q': 'сок'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'shop/product_search.html')
+        self.assertEqual(response.context['products'], [self.juice])
+
+    def test_search_view_htmx_partial(self):
+        response = self.client.get(self.url, {'q': 'сок'}, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'shop/product_search_partial.html')
+
+    def test_search_view_empty_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['products'], [])
+
+    def test_search_view_invalid_cursor(self):
+        response = self.client.get(self.url, {'q': 'чай', 'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductAutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Напитки')
+        self.green_tea = Product.objects.create(category=self.category, name='Зелёный чай', price=10, count=5)
+        self.black_tea = Product.objects.create(category=self.category, name='Черный чай', price=10, count=5)
+        self.coffee = Product.objects.create(category=self.category, name='Кофе латте', price=10, count=5)
+        self.url = reverse('shop:product_autocomplete')
+
+    def test_autocomplete_by_prefix(self):
+        response = self.client.get(self.url, {'q': 'латт'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [{
+            'name': self.coffee.name,
+            'slug': self.coffee.slug,
+            'url': self.coffee.get_absolute_url(),
+        }])
+
+    def test_autocomplete_folds_case_and_yo(self):
+        slugs = [item['slug'] for item in autocomplete_products('ЗЕЛЕНЫЙ')]
+        self.assertEqual(slugs, [self.green_tea.slug])
+        slugs = [item['slug'] for item in autocomplete_products('чёрный')]
+        self.assertEqual(slugs, [self.black_tea.slug])
+
+    def test_autocomplete_tolerates_typos(self):
+        slugs = [item['slug'] for item in autocomplete_products('зиленый')]
+        self.assertIn(self.green_tea.slug, slugs)
+
+    def test_autocomplete_respects_limit(self):
+        self.assertEqual(len(autocomplete_products('чай', limit=1)), 1)
+
+    def test_autocomplete_ignores_short_queries(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(autocomplete_products('ч'), [])
+
+    def test_autocomplete_cached_per_prefix(self):
+        autocomplete_products('чай')
+
+        with self.assertNumQueries(0):
+            results = autocomplete_products(' Чай ')
+        self.assertEqual(len(results), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductListFilterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='filter_user', password='testpass', email='filter@example.com')
+        self.category = Category.objects.create(name='Снеки')
+        self.other_category = Category.objects.create(name='Кофе')
+        self.cheap = Product.objects.create(category=self.category, name='Миндаль', price=50, count=5)
+        self.middle = Product.objects.create(category=self.category, name='Маффин', price=150, count=0)
+        self.expensive = Product.objects.create(category=self.category, name='Торт', price=700, count=2)
+        Product.objects.create(category=self.other_category, name='Латте', price=150, count=3)
+        Feedback.objects.create(user=self.user, product=self.middle, rating=5)
+        Feedback.objects.create(user=self.user, product=self.expensive, rating=3)
+        self.url = reverse('shop:product_list_by_category', args=[self.category.slug])
+
+    def test_filter_by_price(self):
+        response = self.client.get(self.url, {'price': '100-200'})
+        self.assertEqual(list(response.context['products']), [self.middle])
+
+    def test_filter_by_rating(self):
+        response = self.client.get(self.url, {'rating': '4'})
+        self.assertEqual(list(response.context['products']), [self.middle])
+
+    def test_filters_combine(self):
+        response = self.client.get(self.url, {'rating': '3', 'in_stock': '1'})
+        self.assertEqual(list(response.context['products']), [self.expensive])
+
+    def test_invalid_filter_is_ignored(self):
+        response = self.client.get(self.url, {'price': 'free'})
+        self.assertEqual(len(response.context['products']), 3)
+        self.assertEqual(response.context['filter_query'], '')
+
+    def test_facet_counts_per_category(self):
+        facets = self.client.get(self.url).context['facets']
+        self.assertEqual([option['count'] for option in facets['price']], [1, 1, 0, 0, 1])
+        self.assertEqual([option['count'] for option in facets['rating']], [2, 1, 1])
+        self.assertEqual(facets['in_stock']['count'], 2)
+
+        facets = self.client.get(reverse('shop:product_list')).context['facets']
+        self.assertEqual(facets['price'][1]['count'], 2)
+
+    def test_facet_counts_cached_and_invalidated(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            get_facet_counts(self.category)
+
+        Product.objects.create(category=self.category, name='Печенье', price=20, count=1)
+        self.assertEqual(get_facet_counts(self.category)['price:0-100'], 2)
+
+    def test_cursor_loader_keeps_filters(self):
+        for i in range(10):
+            Product.objects.create(category=self.category, name=f'Орех {i}', price=10, count=1)
+
+        response = self.client.get(self.url, {'price': '0-100'})
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, f'?price=0-100&cursor={next_cursor}')
+
+        response = self.client.get(self.url, {'price': '0-100', 'cursor': next_cursor}, HTTP_HX_REQUEST='true')
+        self.assertEqual(len(response.context['products']), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductCardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Соки')
+        self.products = [
+            Product.objects.create(category=self.category, name=f'Сок {i}', price=10, count=5)
+            for i in range(3)
+        ]
+
+    def render(self):
+        with patch('shop.catalog.render_to_string', wraps=render_to_string) as mocked_render:
+            html = render_product_cards(Product.objects.all())
+        return html, mocked_render.call_count
+
+    def test_cards_rendered_once(self):
+        html, rendered = self.render()
+        self.assertEqual(rendered, 3)
+        self.assertIn('Сок 0', html)
+
+        cached_html, rendered = self.render()
+        self.assertEqual(rendered, 0)
+        self.assertEqual(cached_html, html)
+
+    def test_cards_fetched_with_one_multi_get(self):
+        self.render()
+
+        with patch.object(cache, 'get_many', wraps=cache.get_many) as mocked_get_many:
+            self.render()
+        self.assertEqual(mocked_get_many.call_count, 1)
+
+    def test_only_changed_card_rerendered(self):
+        self.render()
+        product = self.products[0]
+        product.name = 'Томатный сок'
+        product.save()
+
+        html, rendered = self.render()
+        self.assertEqual(rendered, 1)
+        self.assertIn('Томатный сок', html)
+
+    def test_stock_change_rerenders_card(self):
+        self.render()
+        Product.objects.filter(pk=self.products[1].pk).update(count=0)
+
+        html, rendered = self.render()
+        self.assertEqual(rendered, 1)
+        self.assertIn('раскупили', html)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@example.com')
+        self.category = Category.objects.create(name='Чай')
+        self.product = Product.objects.create(category=self.category, name='Улун', price=10, count=5)
+        self.list_url = reverse('shop:product_list_by_category', args=[self.category.slug])
+        self.detail_url = reverse('shop:product_detail', args=[self.product.slug])
+
+    def test_list_not_modified_for_matching_etag(self):
+        response = self.client.get(self.list_url)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_list_etag_differs_for_partial(self):
+        full = self.client.get(self.list_url)
+        partial = self.client.get(self.list_url, HTTP_HX_REQUEST='true', HTTP_IF_NONE_MATCH=full['ETag'])
+        self.assertEqual(partial.status_code, 200)
+        self.assertIn('HX-Request', partial['Vary'])
+
+    def test_list_etag_changes_with_catalog(self):
+        etag = self.client.get(self.list_url)['ETag']
+        Product.objects.create(category=self.category, name='Пуэр', price=10, count=5)
+
+        response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_detail_not_modified_since(self):
+        response = self.client.get(self.detail_url)
+
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_changes_with_review(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        Feedback.objects.create(user=self.user, product=self.product, rating=5, review='Отличный')
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Отличный')
+
+    def test_detail_etag_follows_slug_change(self):
+        self.client.get(self.detail_url)
+        self.product.name = 'Тегуаньинь'
+        self.product.save()
+
+        response = self.client.get(reverse('shop:product_detail', args=[self.product.slug]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+
+    def test_no_validators_for_authenticated_user(self):
+        self.client.login(username='buyer', password='testpass')
+
+        for url in (self.list_url, self.detail_url):
+            response = self.client.get(url)
+            self.assertNotIn('ETag', response)
+            self.assertNotIn('Last-Modified', response)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@example.com')
+        self.category = Category.objects.create(name='Какао')
+        self.product = Product.objects.create(category=self.category, name='Какао', price=10, count=5)
+        self.url = reverse('shop:product_detail', args=[self.product.slug])
+
+    def expire(self, url, **headers):
+        key = get_page_key(RequestFactory().get(url, **headers))
+        entry = cache.get(key)
+        entry['fresh_until'] = 0
+        cache.set(key, entry)
+        return key
+
+    def test_page_served_from_cache(self):
+        self.client.get(self.url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.templates, [])
+        self.assertContains(response, 'Какао')
+
+    def test_page_regenerated_after_change(self):
+        self.client.get(self.url)
+        Product.objects.filter(pk=self.product.pk).update(price=42)
+        self.product.save(update_fields=['count'])
+
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'shop/product_detail.html')
+        self.assertContains(response, '42')
+
+    def test_stale_page_served_while_locked(self):
+        self.client.get(self.url)
+        key = self.expire(self.url)
+        cache.add(f'{key}:lock', 1)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.templates, [])
+
+        cache.delete(f'{key}:lock')
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'shop/product_detail.html')
+        self.assertIsNone(cache.get(f'{key}:lock'))
+
+    def test_cold_miss_waits_for_lock_holder(self):
+        self.client.get(self.url)
+        key = get_page_key(RequestFactory().get(self.url))
+        entry = cache.get(key)
+        cache.delete(key)
+        cache.add(f'{key}:lock', 1)
+
+        with patch('chillsip.pagecache.time.sleep', side_effect=lambda seconds: cache.set(key, entry)):
+            response = self.client.get(self.url)
+        self.assertEqual(response.templates, [])
+
+    def test_cold_miss_renders_when_lock_holder_is_slow(self):
+        key = get_page_key(RequestFactory().get(self.url))
+        cache.add(f'{key}:lock', 1)
+
+        with patch('chillsip.pagecache.time.sleep') as sleep:
+            response = self.client.get(self.url)
+        self.assertEqual(sleep.call_count, 20)
+        self.assertTemplateUsed(response, 'shop/product_detail.html')
+        self.assertEqual(cache.get(f'{key}:lock'), 1)
+
+    def test_partial_cached_separately(self):
+        url = reverse('shop:product_list')
+        self.client.get(url)
+
+        response = self.client.get(url, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'shop/product_partial.html')
+
+    def test_authenticated_user_not_cached(self):
+        self.client.get(self.url)
+        self.client.login(username='buyer', password='testpass')
+
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, 'shop/product_detail.html')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        singleflight.reset_stats()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_value_computed_once(self):
+        self.assertEqual(singleflight.get_or_set('key', self.compute, 60), 1)
+        self.assertEqual(singleflight.get_or_set('key', self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(singleflight.get_stats(), {'hit': 1, 'miss': 1, 'coalesced': 0, 'refresh': 0})
+
+    def test_waiter_gets_value_of_lock_holder(self):
+        cache.add('singleflight:key:lock', 1)
+
+        def other_worker_finishes(seconds):
+            cache.set('singleflight:key', ('ready', 0, float('inf')))
+
+        with patch('chillsip.singleflight.time.sleep', side_effect=other_worker_finishes):
+            self.assertEqual(singleflight.get_or_set('key', self.compute, 60), 'ready')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(singleflight.get_stats()['coalesced'], 1)
+
+    def test_last_value_served_while_refreshing(self):
+        cache.set('singleflight:key', ('old', 0, 0))
+        cache.add('singleflight:key:lock', 1)
+
+        self.assertEqual(singleflight.get_or_set('key', self.compute, 60), 'old')
+        self.assertEqual(self.calls, 0)
+
+        cache.delete('singleflight:key:lock')
+        self.assertEqual(singleflight.get_or_set('key', self.compute, 60), 1)
+        self.assertIsNone(cache.get('singleflight:key:lock'))
+
+    def test_early_refresh_before_expiry(self):
+        singleflight.get_or_set('key', self.compute, 60)
+        value, delta, expires = cache.get('singleflight:key')
+        cache.set('singleflight:key', (value, 60, expires))
+
+        with patch('chillsip.singleflight.random.random', return_value=0.99):
+            self.assertEqual(singleflight.get_or_set('key', self.compute, 60), 2)
+        self.assertEqual(singleflight.get_stats()['refresh'], 1)
+
+    def test_lock_released_on_error(self):
+        with self.assertRaises(ZeroDivisionError):
+            singleflight.get_or_set('key', lambda: 1 / 0, 60)
+        self.assertIsNone(cache.get('singleflight:key:lock'))
+
+    def test_lock_of_another_worker_kept(self):
+        def slow_compute():
+            cache.set('singleflight:key:lock', 'other')
+            return self.compute()
+
+        self.assertEqual(singleflight.get_or_set('key', slow_compute, 60), 1)
+        self.assertEqual(cache.get('singleflight:key:lock'), 'other')
+
+    def test_stats_batched_per_process(self):
+        singleflight.get_or_set('key', self.compute, 60)
+        singleflight.get_or_set('key', self.compute, 60)
+
+        self.assertIsNone(cache.get(singleflight.get_stats_key('hit')))
+        self.assertEqual(singleflight.get_stats()['hit'], 1)
+
+    def test_stats_command(self):
+        singleflight.get_or_set('key', self.compute, 60)
+        out = StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+
+        self.assertIn('miss: 1', out.getvalue())
+        self.assertEqual(singleflight.get_stats()['miss'], 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LocalCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reference_cache.invalidate()
+        self.category = Category.objects.create(name='Морсы')
+        self.street = Street.objects.create(name='Садовая')
+
+    def test_reference_lookups_skip_shared_cache(self):
+        get_categories()
+        get_category(self.category.slug)
+        get_streets()
+
+        with self.assertNumQueries(0), patch.object(cache, 'get') as mocked_get:
+            self.assertEqual(get_categories(), [self.category])
+            self.assertEqual(get_category(self.category.slug), self.category)
+            self.assertEqual(get_streets(), [self.street])
+        mocked_get.assert_not_called()
+
+    def test_category_change_invalidates(self):
+        get_categories()
+        self.category.name = 'Кисели'
+        self.category.save()
+
+        self.assertEqual(get_categories()[0].name, 'Кисели')
+        self.assertEqual(get_category(self.category.slug), self.category)
+
+    def test_street_change_invalidates(self):
+        get_streets()
+        Street.objects.create(name='Абрикосовая')
+
+        self.assertEqual([street.name for street in get_streets()], ['Абрикосовая', 'Садовая'])
+
+    def test_other_worker_picks_up_generation(self):
+        worker = LocalCache('reference', check_interval=0)
+        self.assertEqual(worker.get_or_set('streets', get_streets, 60), [self.street])
+        street = Street.objects.create(name='Абрикосовая')
+
+        self.assertIn(street, worker.get_or_set('streets', get_streets, 60))
+
+    def test_size_bounded(self):
+        local = LocalCache('test', size=2)
+        for key in ('a', 'b', 'c'):
+            local.get_or_set(key, lambda: key, 60)
+        self.assertEqual(list(local.entries), ['b', 'c'])
+
+    def test_order_form_uses_cached_streets(self):
+        get_streets()
+
+        with self.assertNumQueries(0):
+            html = str(OrderForm()['street'])
+        self.assertIn('Садовая', html)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductPrerenderTests(TestRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(PRERENDER_ROOT=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@example.com')
+        self.category = Category.objects.create(name='Лимонады')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(category=self.category, name='Тархун', price=10, count=5)
+        render_queued_pages()
+
+    def snapshot(self, slug):
+        return get_snapshot_path(slug).read_text(encoding='utf-8')
+
+    def test_snapshot_written_on_save(self):
+        path = get_snapshot_path(self.product.slug)
+        self.assertEqual(path.parts[-3:], ('product', self.product.slug, 'index.html'))
+        self.assertIn('Тархун', self.snapshot(self.product.slug))
+
+    def test_snapshot_refreshed_on_review(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Feedback.objects.create(user=self.user, product=self.product, rating=4, review='Освежает')
+        self.assertNotIn('Освежает', self.snapshot(self.product.slug))
+
+        self.assertEqual(render_queued_pages(), 1)
+        self.assertIn('Освежает', self.snapshot(self.product.slug))
+
+    def test_snapshot_moved_on_rename(self):
+        old_slug = self.product.slug
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Дюшес'
+            self.product.save()
+        render_queued_pages()
+
+        self.assertFalse(get_snapshot_path(old_slug).exists())
+        self.assertIn('Дюшес', self.snapshot(self.product.slug))
+
+    def test_snapshot_removed_on_delete(self):
+        slug = self.product.slug
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        self.assertFalse(get_snapshot_path(slug).exists())
+
+    def test_snapshot_is_anonymous(self):
+        self.assertNotIn('csrfmiddlewaretoken', self.snapshot(self.product.slug))
+        self.assertIn(reverse('account:login'), self.snapshot(self.product.slug))
+
+    def test_category_save_queues_pages(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.product.pk).update(name='Дюшес')
+            self.category.save()
+        self.assertIn('Тархун', self.snapshot(self.product.slug))
+
+        out = StringIO()
+        call_command('prerender_products', '--queue', stdout=out)
+        self.assertIn('Сохранено 1', out.getvalue())
+        self.assertIn('Дюшес', self.snapshot(self.product.slug))
+
+    def test_command_renders_all_products(self):
+        Product.objects.create(category=self.category, name='Буратино', price=10, count=5)
+        out = StringIO()
+        call_command('prerender_products', stdout=out)
+
+        self.assertIn('Сохранено 2', out.getvalue())
+        self.assertIn('Буратино', self.snapshot(Product.objects.get(name='Буратино').slug))
+
+
+def make_image_file(name='photo.jpg', size=(1000, 500)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color='orange').save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp_dir.name, PRERENDER_ROOT=f'{tmp_dir.name}/prerender')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.name = default_storage.save('products/2025/01/01/photo.jpg', make_image_file())
+
+    def test_variants_generated(self):
+        self.assertEqual(generate_variants(self.name), 8)
+
+        with default_storage.open(get_variant_name(self.name, 640, 'webp')) as f:
+            image = Image.open(f)
+            self.assertEqual((image.format, image.size), ('WEBP', (640, 320)))
+        with default_storage.open(get_variant_name(self.name, 1280, 'jpg')) as f:
+            self.assertEqual(Image.open(f).size, (1000, 500))
+        self.assertEqual(generate_variants(self.name), 0)
+
+    def test_picture_tag(self):
+        template = Template("{% load shop_tags %}{% picture image 'images/profile.jpg' 'userFoto' '3rem' %}")
+        product = Product(image=self.name, image_width=1000)
+
+        with self.assertNumQueries(0):
+            html = template.render(Context({'image': product.image}))
+        self.assertNotIn('srcset', html)
+
+        product.image_variants = True
+        html = template.render(Context({'image': product.image}))
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn(f'{default_storage.url(get_variant_name(self.name, 160, "webp"))} 160w', html)
+        self.assertIn(f'{default_storage.url(get_variant_name(self.name, 1280, "webp"))} 1000w', html)
+        self.assertNotIn(' 1280w', html)
+        self.assertIn('sizes="3rem"', html)
+
+        html = template.render(Context({'image': None}))
+        self.assertIn('images/profile.jpg', html)
+
+    def test_variants_built_by_worker(self):
+        category = Category.objects.create(name='Фото')
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(category=category, name='Фото', price=1, count=1, image=make_image_file())
+        self.assertFalse(default_storage.exists(get_variant_name(product.image.name, 160, 'webp')))
+
+        out = StringIO()
+        call_command('build_image_variants', '--pending', stdout=out)
+        self.assertIn('Готовы копии для 1 изображений', out.getvalue())
+        product.refresh_from_db()
+        self.assertTrue(product.image_variants)
+        for variant in get_variant_names(product.image.name):
+            self.assertTrue(default_storage.exists(variant))
+
+    def test_broken_image_skipped_on_later_passes(self):
+        category = Category.objects.create(name='Фото')
+        name = default_storage.save('products/broken.jpg', ContentFile(b'broken'))
+        product = Product.objects.create(category=category, name='Фото', price=1, count=1, image=name)
+
+        def sleep(seconds):
+            if os.path.getsize(default_storage.path(name)) > len(b'broken'):
+                raise KeyboardInterrupt
+            with open(default_storage.path(name), 'wb') as f:
+                f.write(make_image_file().read())
+
+        with patch('shop.management.commands.build_image_variants.time.sleep', side_effect=sleep):
+            with self.assertRaises(KeyboardInterrupt):
+                call_command('build_image_variants', '--pending', '--interval', '5', stdout=StringIO())
+
+        product.refresh_from_db()
+        self.assertFalse(product.image_variants)
+        self.assertFalse(default_storage.exists(get_variant_name(name, 160, 'webp')))
+
+    def test_replaced_image_variants_deleted(self):
+        category = Category.objects.create(name='Фото')
+        product = Product.objects.create(category=category, name='Фото', price=1, count=1, image=make_image_file())
+        call_command('build_image_variants', '--pending', stdout=StringIO())
+        product.refresh_from_db()
+        previous = product.image.name
+
+        product.image = make_image_file(size=(800, 800))
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+        self.assertFalse(product.image_variants)
+        for variant in get_variant_names(previous):
+            self.assertFalse(default_storage.exists(variant))
+
+    def test_shared_image_variants_kept(self):
+        category = Category.objects.create(name='Фото')
+        product = Product.objects.create(category=category, name='Фото', price=1, count=1, image=make_image_file())
+        Product.objects.create(category=category, name='Копия', price=1, count=1, image=product.image.name)
+        call_command('build_image_variants', '--pending', stdout=StringIO())
+        product.refresh_from_db()
+        previous = product.image.name
+
+        product.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+
+        self.assertTrue(default_storage.exists(get_variant_name(previous, 160, 'webp')))
+
+    def test_backfill_command(self):
+        out = StringIO()
+        call_command('build_image_variants', '--workers', '2', stdout=out)
+
+        self.assertIn('создано 8', out.getvalue())
+        self.assertTrue(default_storage.exists(get_variant_name(self.name, 320, 'jpg')))
+
+
+class ImagePlaceholderTests(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp_dir.name, PRERENDER_ROOT=f'{tmp_dir.name}/prerender')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Превью')
+
+    def test_meta_filled_on_upload(self):
+        product = Product.objects.create(category=self.category, name='Фото', price=1, count=1, image=make_image_file())
+
+        product.refresh_from_db()
+        self.assertEqual((product.image_width, product.image_height), (1000, 500))
+        self.assertTrue(product.image_placeholder.startswith('data:image/webp;base64,'))
+        self.assertLess(len(product.image_placeholder), 400)
+
+    def test_meta_cleared_with_image(self):
+        product = Product.objects.create(category=self.category, name='Фото', price=1, count=1, image=make_image_file())
+        product.image = None
+        product.save()
+
+        product.refresh_from_db()
+        self.assertEqual((product.image_width, product.image_height, product.image_placeholder), (None, None, ''))
+
+    def test_user_foto_meta(self):
+        user = User.objects.create_user(username='buyer', password='testpass', email='buyer@example.com')
+        user.foto = make_image_file(size=(300, 300))
+        user.save()
+
+        self.assertEqual(user.foto_width, 300)
+        self.assertTrue(user.foto_placeholder)
+
+    def test_picture_tag_renders_placeholder(self):
+        product = Product.objects.create(category=self.category, name='Фото', price=1, count=1, image=make_image_file())
+        html = Template("{% load shop_tags %}{% picture image 'x.jpg' 'item__image' %}").render(Context({'image': product.image}))
+
+        self.assertIn('width="1000" height="500"', html)
+        self.assertIn(f'style="background-image:url({product.image_placeholder})"', html)
+        self.assertIn('class="item__image placeholder"', html)
+
+    def test_backfill_command(self):
+        name = default_storage.save('products/old.jpg', make_image_file(size=(200, 100)))
+        product = Product.objects.create(category=self.category, name='Старое', price=1, count=1)
+        Product.objects.filter(pk=product.pk).update(image=name)
+        out = StringIO()
+
+        call_command('build_image_placeholders', '--workers', '2', stdout=out)
+        product.refresh_from_db()
+        self.assertIn('Обновлено 1', out.getvalue())
+        self.assertEqual((product.image_width, product.image_height), (200, 100))
+        self.assertTrue(product.image_placeholder)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ImageResizeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=tmp_dir.name, RESIZE_ROOT=f'{tmp_dir.name}/resize')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.name = default_storage.save('products/2025/01/01/photo.jpg', make_image_file())
+        self.url = reverse('image_resize', args=[320, 320, self.name])
+
+    def test_resized_on_first_request(self):
+        self.assertEqual(self.url, f'/media/resize/320x320/{self.name}')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=2592000', response['Cache-Control'])
+        image = Image.open(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(image.size, (320, 160))
+        self.assertTrue(resize.get_target_path(320, 320, self.name).exists())
+
+    def test_cached_file_reused(self):
+        self.client.get(self.url)
+
+        with patch('chillsip.resize.resize') as mocked_resize:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        mocked_resize.assert_not_called()
+
+    def test_rejected_requests(self):
+        urls = [
+            reverse('image_resize', args=[333, 320, self.name]),
+            reverse('image_resize', args=[320, 320, 'products/missing.jpg']),
+            '/media/resize/320x320/products/../../etc/passwd',
+            reverse('image_resize', args=[320, 320, 'resize/320x320/products/photo.jpg']),
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_traversal_outside_resize_root_rejected(self):
+        secret = os.path.join(settings.MEDIA_ROOT, 'secret.txt')
+        with open(secret, 'w') as f:
+            f.write('SECRET_KEY')
+        os.makedirs(os.path.join(settings.RESIZE_ROOT, '80x80', 'products'))
+
+        for path in ('products/../../../secret.txt', '/products/../secret.txt', 'products/../../secret.txt'):
+            self.assertIsNone(resize.get_resized(80, 80, path), path)
+        response = self.client.get('/media/resize/80x80/products/../../../secret.txt')
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_requests_coalesced(self):
+        original = resize.resize
+        calls = []
+
+        def slow_resize(*args):
+            calls.append(args)
+            time.sleep(0.2)
+            return original(*args)
+
+        with patch('chillsip.resize.resize', side_effect=slow_resize):
+            threads = [
+                threading.Thread(target=resize.get_resized, args=(160, 160, self.name))
+                for i in range(4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+
+    def test_cache_size_capped(self):
+        names = [default_storage.save(f'posts/photo{i}.jpg', make_image_file()) for i in range(3)]
+        first = resize.get_resized(640, 640, names[0])
+        os.utime(first, (1, 1))
+        size = first.stat().st_size
+
+        with override_settings(RESIZE_CACHE_MAX_BYTES=int(size * 2.5)):
+            for name in names[1:]:
+                resize.get_resized(640, 640, name)
+
+        self.assertFalse(first.exists())
+        self.assertTrue(resize.get_target_path(640, 640, names[2]).exists())
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=tmp_dir.name, PRERENDER_ROOT=f'{tmp_dir.name}/prerender', RESIZE_ROOT=f'{tmp_dir.name}/resize',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.category = Category.objects.create(name='Хранилище')
+
+    def test_same_content_stored_once(self):
+        first = Product.objects.create(category=self.category, name='Первый', price=1, count=1, image=make_image_file('a.JPG'))
+        second = Product.objects.create(category=self.category, name='Второй', price=1, count=1, image=make_image_file('b.jpg'))
+        other = Product.objects.create(category=self.category, name='Третий', price=1, count=1, image=make_image_file(size=(10, 10)))
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertNotEqual(first.image.name, other.image.name)
+        self.assertRegex(first.image.name, r'^products/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(len(list(find_images(settings.MEDIA_ROOT))), 2)
+
+    def test_reused_file_not_collected(self):
+        name = content_storage.save('posts/orphan.jpg', make_image_file(size=(20, 20)))
+        old = time.time() - 2 * GARBAGE_GRACE_PERIOD
+        os.utime(content_storage.path(name), (old, old))
+
+        self.assertEqual(content_storage.save('posts/again.jpg', make_image_file(size=(20, 20))), name)
+        self.assertGreater(os.path.getmtime(content_storage.path(name)), old + GARBAGE_GRACE_PERIOD)
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertTrue(content_storage.exists(name))
+
+    def test_garbage_collected(self):
+        product = Product.objects.create(category=self.category, name='Фото', price=1, count=1, image=make_image_file())
+        orphan = content_storage.save('posts/orphan.jpg', make_image_file(size=(20, 20)))
+        recent = content_storage.save('foto/recent.jpg', make_image_file(size=(30, 30)))
+        old = time.time() - 2 * GARBAGE_GRACE_PERIOD
+        for name in (product.image.name, orphan):
+            os.utime(content_storage.path(name), (old, old))
+        generate_variants(orphan)
+        resize.get_resized(160, 160, orphan)
+
+        out = StringIO()
+        call_command('collect_media_garbage', '--dry-run', stdout=out)
+        self.assertIn(orphan, out.getvalue())
+        self.assertTrue(content_storage.exists(orphan))
+
+        call_command('collect_media_garbage', stdout=StringIO())
+        self.assertFalse(content_storage.exists(orphan))
+        self.assertFalse(default_storage.exists(get_variant_name(orphan, 160, 'webp')))
+        self.assertFalse(resize.get_target_path(160, 160, orphan).exists())
+        self.assertTrue(content_storage.exists(product.image.name))
+        self.assertTrue(content_storage.exists(recent))
+
+
+class ProductImagePoolTests(TestRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.category = Category.objects.create(name='Выпечка')
+        self.with_image = Product.objects.create(
+            category=self.category,
+            name='Маффин',
+            image='products/muffin.jpg',
+            price=10,
+            count=5
+        )
+        self.without_image = Product.objects.create(
+            category=self.category,
+            name='Сконы',
+            price=10,
+            count=5
+        )
+
+    def pool(self):
+        return {id.decode('utf-8') for id in self.redis.smembers(IMAGE_POOL_KEY)}
+
+    def test_pool_tracks_products_with_images(self):
+        self.assertEqual(self.pool(), {str(self.with_image.id)})
+
+    def test_pool_updated_when_image_removed(self):
+        self.with_image.image = None
+        self.with_image.save()
+        self.assertEqual(self.pool(), set())
+
+    def test_pool_updated_on_delete(self):
+        self.with_image.delete()
+        self.assertEqual(self.pool(), set())
+
+    def test_random_products_hydrated_with_one_query(self):
+        with self.assertNumQueries(1):
+            products = get_random_products()
+        self.assertEqual(products, [self.with_image])
+
+    def test_pool_rebuilt_when_missing(self):
+        self.redis.delete(IMAGE_POOL_KEY)
+        with patch('shop.catalog.rebuild_image_pool', wraps=rebuild_image_pool) as mocked_rebuild:
+            products = get_random_products()
+        mocked_rebuild.assert_called_once_with()
+        self.assertEqual(products, [self.with_image])
+        self.assertEqual(self.pool(), {str(self.with_image.id)})
+
+
 class ProductDetailViewTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpass',email='testemail')
@@ -375,6 +1533,113 @@ class ProductDetailViewTests(TestCase):
         self.assertTrue(response.context['is_product_in_cart'])
 
 
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductDetailQueryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Смузи')
+        self.product = Product.objects.create(category=self.category, name='Манго', price=100, count=10)
+        self.user = User.objects.create_user(username='buyer', password='testpass', email='buyer@example.com')
+        self.url = self.product.get_absolute_url()
+
+    def add_reviews(self, count):
+        for i in range(count):
+            user = User.objects.create_user(username=f'reviewer{i}', password='testpass', email=f'reviewer{i}@example.com')
+            Feedback.objects.create(user=user, product=self.product, rating=5, review=f'Отзыв {i}')
+
+    def test_anonymous_query_budget(self):
+        self.add_reviews(3)
+        self.client.get(self.url)
+        cache.delete(get_page_key(RequestFactory().get(self.url)))
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'reviewer2')
+
+    def test_authenticated_query_budget(self):
+        self.add_reviews(3)
+        Cart.objects.create(user=self.user, product=self.product, price=100, count=1)
+        self.client.login(username='buyer', password='testpass')
+        self.client.get(self.url)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url)
+        self.assertTrue(response.context['is_product_in_cart'])
+
+    def test_budget_does_not_grow_with_reviews(self):
+        self.add_reviews(1)
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as one_review:
+            self.client.get(self.url)
+
+        for i in range(2):
+            user = User.objects.create_user(username=f'late{i}', password='testpass', email=f'late{i}@example.com')
+            Feedback.objects.create(user=user, product=self.product, rating=4, review=f'Поздний {i}')
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as three_reviews:
+            self.client.get(self.url)
+
+        self.assertEqual(len(one_review), len(three_reviews))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProductReviewPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Квас')
+        self.product = Product.objects.create(category=self.category, name='Хлебный', price=100, count=10)
+        self.feedbacks = []
+        for i in range(7):
+            user = User.objects.create_user(username=f'reviewer{i}', password='testpass', email=f'reviewer{i}@example.com')
+            self.feedbacks.append(
+                Feedback.objects.create(user=user, product=self.product, rating=4, review=f'Отзыв {i}' if i != 3 else '')
+            )
+        self.reviews_url = reverse('shop:product_reviews', args=[self.product.slug])
+
+    def test_review_count_denormalized(self):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 6)
+
+        feedback = self.feedbacks[0]
+        feedback.review = None
+        feedback.save(update_fields=['review'])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 5)
+
+    def test_detail_shows_first_page_and_count(self):
+        response = self.client.get(self.product.get_absolute_url())
+        reviews = response.context['reviews']
+
+        self.assertEqual([feed.review for feed in reviews], ['Отзыв 6', 'Отзыв 5', 'Отзыв 4'])
+        self.assertContains(response, 'отзывы: 6')
+        self.assertContains(response, f'href="{self.product.get_absolute_url()}?reviews_cursor={reviews.next_cursor}"')
+        self.assertContains(response, f'hx-get="{self.reviews_url}?cursor={reviews.next_cursor}"')
+
+    def test_detail_follows_reviews_cursor(self):
+        first = self.client.get(self.product.get_absolute_url()).context['reviews']
+        response = self.client.get(self.product.get_absolute_url(), {'reviews_cursor': first.next_cursor})
+
+        self.assertTemplateUsed(response, 'shop/product_detail.html')
+        self.assertEqual([feed.review for feed in response.context['reviews']], ['Отзыв 2', 'Отзыв 1', 'Отзыв 0'])
+        self.assertEqual(self.client.get(self.product.get_absolute_url(), {'reviews_cursor': 'broken'}).status_code, 404)
+
+    def test_fragment_follows_cursor(self):
+        first = self.client.get(self.product.get_absolute_url()).context['reviews']
+
+        with self.assertNumQueries(2):
+            response = self.client.get(self.reviews_url, {'cursor': first.next_cursor}, HTTP_HX_REQUEST='true')
+        self.assertTemplateUsed(response, 'shop/review_partial.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        second = response.context['reviews']
+        self.assertEqual([feed.review for feed in second], ['Отзыв 2', 'Отзыв 1', 'Отзыв 0'])
+        self.assertFalse(second.has_next())
+        self.assertNotContains(response, 'еще отзывы')
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(self.reviews_url, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+
 class CartListViewTests(TestCase):
 
     def setUp(self):
@@ -478,22 +1743,6 @@ class CartAddProductViewTests(TestCase):
         self.assertRedirects(response, self.product.get_absolute_url())
         self.assertFalse(Cart.objects.filter(user=self.user, product=self.product).exists())
 
-    def test_transaction_rollback_on_error(self):
-        self.client.login(username='testuser', password='testpass123')
-     
-        original_count = self.product.count
-
-        with patch('shop.views.Cart.objects.get_or_create') as mocked_get_or_create:
-            mocked_get_or_create.side_effect = IntegrityError('Forced integrity error')
-
-            with self.assertRaises(IntegrityError):  
-                self.client.get(self.url)
-
-        self.assertFalse(Cart.objects.filter(user=self.user, product=self.product).exists())
-
-        self.product.refresh_from_db()
-        self.assertEqual(self.product.count, original_count)
-
 
 class CartDeleteProductViewTests(TestCase):
     def setUp(self):
@@ -527,20 +1776,6 @@ class CartDeleteProductViewTests(TestCase):
     def test_login_required(self):
         response = self.client.get(self.url)
         self.assertRedirects(response, f"/account/login/?next={self.url}")
-    
-    def test_transaction_rollback_on_delete_error(self):
-        self.client.login(username='testuser', password='testpass123')
-
-        original_count = self.product.count
-
-        with patch('shop.models.Cart.delete', side_effect=IntegrityError("Forced error")):
-            with self.assertRaises(IntegrityError):
-                self.client.get(self.url)
-
-        self.assertTrue(Cart.objects.filter(id=self.cart_item.id).exists())
-
-        self.product.refresh_from_db()
-        self.assertEqual(self.product.count, original_count)
 
 
 class CartIncrementViewTests(TestCase):
@@ -644,24 +1879,510 @@ class CartDecrementViewTests(TestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 302)
         self.assertIn('/account/login/', response.url)
-    
-    def test_transaction_rollback_on_error(self):
+
+class CartMutationQueryTests(TestRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='testuser', email='test@example.com', password='password123')
+        self.category = Category.objects.create(name='testcategory')
+        self.product = Product.objects.create(name='Test Product', category=self.category, price=10, count=5)
+        self.cart_item = Cart.objects.create(user=self.user, product=self.product, count=2, price=self.product.price)
+        self.client.force_login(self.user)
+        self.client.get(reverse('shop:cart_list'))
+
+    def assertStatements(self, url, count):
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertLessEqual(len(queries), count, [q['sql'] for q in queries])
+        return response
+
+    def test_increment_returns_counts(self):
+        response = self.assertStatements(reverse('shop:cart_increment', args=[self.cart_item.id]), 2)
+
+        self.assertEqual(response.json(), {'success': True, 'new_count': 3, 'product_count': 4})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 4)
+
+    def test_decrement_returns_counts(self):
+        response = self.assertStatements(reverse('shop:cart_decrement', args=[self.cart_item.id]), 2)
+
+        self.assertEqual(response.json(), {'success': True, 'new_count': 1, 'product_count': 6})
+
+    def test_add_and_delete(self):
+        other = Product.objects.create(name='Other Product', category=self.category, price=20, count=1)
+
+        self.assertStatements(reverse('shop:cart_add', args=[other.id]), 2)
+        self.assertStatements(reverse('shop:cart_add', args=[other.id]), 3)
+        self.assertEqual(Cart.objects.get(user=self.user, product=other).count, 1)
+
+        self.assertStatements(reverse('shop:cart_delete', args=[self.cart_item.id]), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.count, 7)
+
+    def test_other_users_item_untouched(self):
+        self.client.force_login(User.objects.create_user(username='other', email='other@example.com', password='pass123'))
+        response = self.client.get(reverse('shop:cart_increment', args=[self.cart_item.id]))
+
+        self.assertEqual(response.status_code, 400)
+        self.product.refresh_from_db()
+        self.cart_item.refresh_from_db()
+        self.assertEqual((self.product.count, self.cart_item.count), (5, 2))
+
+    def test_stock_change_flushed_in_background(self):
+        stamp = get_product_stamp(self.product.slug)
+        time.sleep(0.01)
+        self.client.get(reverse('shop:cart_increment', args=[self.cart_item.id]))
+        self.assertEqual(get_product_stamp(self.product.slug), stamp)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(flush_stock_changes(), 1)
+        self.assertGreater(get_product_stamp(self.product.slug), stamp)
+        self.assertTrue(self.redis.sismember(PRERENDER_QUEUE_KEY, self.product.slug))
+
+    def test_selling_out_bumps_catalog_immediately(self):
+        other = Product.objects.create(name='Other Product', category=self.category, price=20, count=1)
+        version = get_catalog_version(self.category.id)
+
+        self.client.get(reverse('shop:cart_increment', args=[self.cart_item.id]))
+        self.assertEqual(get_catalog_version(self.category.id), version)
+
+        self.client.get(reverse('shop:cart_add', args=[other.id]))
+        self.assertEqual(get_catalog_version(self.category.id), version + 1)
+
+        self.client.get(reverse('shop:cart_delete', args=[Cart.objects.get(user=self.user, product=other).id]))
+        self.assertEqual(get_catalog_version(self.category.id), version + 2)
+
+
+class StockConstraintTests(TestCase):
+    def test_negative_stock_rejected(self):
+        product = Product.objects.create(name='Test Product', category=Category.objects.create(name='stock'), price=10, count=1)
+
+        with self.assertRaises(IntegrityError):
+            Product.objects.filter(pk=product.pk).update(count=F('count') - 2)
+
+    def test_reservation_requires_enough_stock(self):
+        user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass123')
+        product = Product.objects.create(name='Test Product', category=Category.objects.create(name='stock'), price=10, count=3)
+
+        self.assertIsNone(add_product(user, product.id, 4))
+        self.assertEqual(add_product(user, product.id, 3), (3, 0))
+        self.assertIsNone(add_product(user, product.id))
+
+
+class StockStressTests(TransactionTestCase):
+    USERS = 16
+    ATTEMPTS = 5
+    STOCK = 30
+
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(PRERENDER_ROOT=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.product = Product.objects.create(name='Hot Product', category=Category.objects.create(name='hot'), price=10, count=self.STOCK)
+        self.users = [
+            User.objects.create_user(username=f'user{i}', email=f'user{i}@example.com', password='pass123')
+            for i in range(self.USERS)
+        ]
+
+    def hammer(self):
+        results = []
+        barrier = threading.Barrier(self.USERS)
+
+        def add(user):
+            try:
+                barrier.wait()
+                for _ in range(self.ATTEMPTS):
+                    results.append(add_product(user, self.product.id))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=add, args=(user,)) for user in self.users]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - started
+
+    def test_no_overselling_under_concurrency(self):
+        results, elapsed = self.hammer()
+
+        self.product.refresh_from_db()
+        reserved = [result for result in results if result]
+        self.assertEqual(len(results), self.USERS * self.ATTEMPTS)
+        self.assertEqual(len(reserved), self.STOCK)
+        self.assertEqual(self.product.count, 0)
+        self.assertEqual(sum(Cart.objects.filter(product=self.product).values_list('count', flat=True)), self.STOCK)
+        self.assertEqual(sorted(product_count for cart_count, product_count in reserved), list(range(self.STOCK)))
+        self.assertGreater(len(results) / elapsed, 25)
+
+
+class HotStockStressTests(StockStressTests):
+    SHARDS = 8
+
+    def setUp(self):
+        super().setUp()
+        shard_stock(self.product.id, self.SHARDS)
+
+    def test_no_overselling_under_concurrency(self):
+        results, elapsed = self.hammer()
+
+        self.assertEqual(len([result for result in results if result]), self.STOCK)
+        self.assertEqual(sum(StockShard.objects.filter(product=self.product).values_list('count', flat=True)), 0)
+        self.assertEqual(sum(Cart.objects.filter(product=self.product).values_list('count', flat=True)), self.STOCK)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, self.STOCK)
+        self.assertEqual(reconcile_stock_shards(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 0)
+        self.assertGreater(len(results) / elapsed, 25)
+
+
+class HotProductTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass123')
+        self.product = Product.objects.create(name='Hot Product', category=Category.objects.create(name='hot'), price=10, count=10)
         self.client.force_login(self.user)
 
-        with patch('shop.models.Cart.save', side_effect=IntegrityError("Forced error")):
-            response = None
+    def get_shards(self):
+        return list(StockShard.objects.filter(product=self.product).values_list('count', flat=True))
+
+    def get_row_version(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT xmin::text FROM shop_product WHERE id = %s', [self.product.id])
+            return cursor.fetchone()[0]
+
+    def test_command_splits_and_merges_stock(self):
+        out = StringIO()
+        call_command('hot_product', self.product.slug, '--shards', '4', stdout=out)
+
+        self.assertIn('Остаток 10 разбит на 4 шардов', out.getvalue())
+        self.assertEqual(self.get_shards(), [3, 3, 2, 2])
+        add_product(self.user, self.product.id, 3)
+
+        call_command('hot_product', self.product.slug, '--shards', '0', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_shards, self.product.count, self.get_shards()), (0, 7, []))
+
+    def test_cart_changes_use_shards(self):
+        shard_stock(self.product.id, 4)
+
+        version = self.get_row_version()
+        self.client.get(reverse('shop:cart_add', args=[self.product.id]))
+        self.assertEqual(self.get_row_version(), version)
+        item = Cart.objects.get(user=self.user)
+
+        self.assertEqual(self.client.get(reverse('shop:cart_increment', args=[item.id])).json()['product_count'], 8)
+        self.assertEqual(self.client.get(reverse('shop:cart_decrement', args=[item.id])).json()['product_count'], 9)
+        self.assertEqual(sum(self.get_shards()), 9)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 10)
+
+        self.client.get(reverse('shop:cart_delete', args=[item.id]))
+        self.assertEqual(sum(self.get_shards()), 10)
+
+    def test_shard_with_stock_is_picked(self):
+        shard_stock(self.product.id, 4)
+        StockShard.objects.filter(product=self.product).exclude(shard=2).update(count=0)
+
+        self.assertEqual(add_product(self.user, self.product.id, 2)[0], 2)
+        self.assertIsNone(add_product(self.user, self.product.id, 1))
+        self.assertEqual(reconcile_stock_shards(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 0)
+
+    def test_take_split_across_shards(self):
+        shard_stock(self.product.id, 4)
+
+        self.assertEqual(add_product(self.user, self.product.id, 5), (5, 5))
+        self.assertEqual(sum(self.get_shards()), 5)
+        self.assertIsNone(add_product(self.user, self.product.id, 6))
+        self.assertEqual(sum(self.get_shards()), 5)
+
+    def test_reshard_updates_rows_in_place(self):
+        shard_stock(self.product.id, 2)
+        ids = list(StockShard.objects.filter(product=self.product).values_list('id', flat=True))
+
+        shard_stock(self.product.id, 3)
+        self.assertEqual(self.get_shards(), [4, 3, 3])
+        self.assertEqual(list(StockShard.objects.filter(product=self.product).values_list('id', flat=True))[:2], ids)
+
+        shard_stock(self.product.id, 1)
+        self.assertEqual(self.get_shards(), [10])
+        self.assertEqual(StockShard.objects.get(product=self.product).id, ids[0])
+
+    def test_admin_count_change_reshards(self):
+        shard_stock(self.product.id, 2)
+        self.product.refresh_from_db()
+        self.product.count = 20
+        self.product.save()
+
+        self.assertEqual(self.get_shards(), [10, 10])
+
+
+class HotProductLockTests(TransactionTestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(PRERENDER_ROOT=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass123')
+        self.product = Product.objects.create(name='Hot Product', category=Category.objects.create(name='hot'), price=10, count=4)
+        shard_stock(self.product.id, 2)
+        StockShard.objects.filter(product=self.product, shard=1).update(count=0)
+
+    def test_waits_for_locked_shard(self):
+        locked = threading.Event()
+
+        def hold_lock():
             try:
-                response = self.client.get(self.url)
-            except IntegrityError:
-                pass 
+                with transaction.atomic():
+                    list(StockShard.objects.select_for_update().filter(product=self.product, shard=0))
+                    locked.set()
+                    time.sleep(0.3)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait(5)
+        try:
+            self.assertEqual(add_product(self.user, self.product.id), (1, 1))
+        finally:
+            thread.join()
+        self.assertEqual(list(StockShard.objects.filter(product=self.product).values_list('count', flat=True)), [1, 0])
+
+
+class CartHoldTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass123')
+        category = Category.objects.create(name='holds')
+        self.products = [
+            Product.objects.create(name=f'Product {i}', category=category, price=10, count=10)
+            for i in range(3)
+        ]
+        for product in self.products:
+            add_product(self.user, product.id, 2)
+        expired = timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT + 1)
+        Cart.objects.filter(product__in=self.products[:2]).update(updated=expired)
+
+    def test_expired_holds_released_in_batches(self):
+        self.assertEqual(release_expired_holds(batch_size=1), 4)
+
+        counts = [Product.objects.get(pk=product.pk).count for product in self.products]
+        self.assertEqual(counts, [10, 10, 8])
+        self.assertEqual(list(Cart.objects.values_list('product', flat=True)), [self.products[2].id])
+        self.assertEqual(release_expired_holds(), 0)
+
+    def test_touched_hold_kept(self):
+        Cart.objects.update(created=timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT + 1))
+        add_product(self.user, self.products[0].id)
+
+        self.assertEqual(release_expired_holds(), 2)
+        self.assertEqual(Cart.objects.get(product=self.products[0]).count, 3)
+
+    def test_one_row_per_product(self):
+        with self.assertRaises(IntegrityError):
+            Cart.objects.create(user=self.user, product=self.products[2], price=10)
 
-            self.cart_item.refresh_from_db()
-            self.product.refresh_from_db()
+    def test_command(self):
+        out = StringIO()
+        call_command('release_cart_holds', stdout=out)
 
-            self.assertEqual(self.cart_item.count, 2)
-            self.assertEqual(self.product.count, 3)
+        self.assertIn('Возвращено на склад 4 шт.', out.getvalue())
 
-            self.assertIsNone(response) 
+
+class CartHoldSweeperConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        tmp_dir = TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        settings_override = override_settings(PRERENDER_ROOT=tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass123')
+        category = Category.objects.create(name='holds')
+        self.locked, self.free = [
+            Product.objects.create(name=f'Product {i}', category=category, price=10, count=5)
+            for i in range(2)
+        ]
+        for product in (self.locked, self.free):
+            add_product(user, product.id)
+        Cart.objects.update(updated=timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT + 1))
+
+    def test_locked_rows_skipped(self):
+        locked = threading.Event()
+        release = threading.Event()
+
+        def hold_lock():
+            try:
+                with transaction.atomic():
+                    list(Cart.objects.select_for_update().filter(product=self.locked))
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        locked.wait(5)
+        try:
+            self.assertEqual(release_expired_holds(), 1)
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(Product.objects.get(pk=self.free.pk).count, 5)
+        self.assertEqual(Product.objects.get(pk=self.locked.pk).count, 4)
+        self.assertEqual(release_expired_holds(), 1)
+
+
+@override_settings(CART_ENGINE='shop.redis_cart')
+class RedisCartTests(TestRedisMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='pass123', account=1000)
+        self.product = Product.objects.create(name='Hot Product', category=Category.objects.create(name='redis'), price=10, count=3)
+        self.client.force_login(self.user)
+
+    def test_clicks_do_not_write_to_database(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('shop:cart_add', args=[self.product.id]))
+            item_id = self.redis.hget(redis_cart.get_cart_key(self.user.pk), f'id:{self.product.id}').decode('utf-8')
+            self.assertEqual(self.client.get(reverse('shop:cart_increment', args=[item_id])).json()['new_count'], 2)
+            self.assertEqual(self.client.get(reverse('shop:cart_decrement', args=[item_id])).json()['product_count'], 2)
+
+        writes = [
+            q['sql'] for q in queries
+            if 'shop_' in q['sql'] and any(verb in q['sql'] for verb in ('UPDATE', 'INSERT', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 3)
+        self.assertFalse(Cart.objects.exists())
+
+        self.assertEqual(redis_cart.persist_carts(), 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 2)
+        self.assertEqual(Cart.objects.get(user=self.user).id, UUID(item_id))
+
+    def test_failing_product_quarantined(self):
+        other = Product.objects.create(name='Other Product', category=self.product.category, price=10, count=3)
+        redis_cart.add_product(self.user, self.product.id, 2)
+        redis_cart.add_product(self.user, other.id, 2)
+        Product.objects.filter(pk=self.product.pk).update(count=1)
+
+        self.assertEqual(redis_cart.apply_pending_stock(), 1)
+        self.assertEqual(Product.objects.get(pk=other.pk).count, 1)
+        self.assertEqual(int(self.redis.hget(redis_cart.QUARANTINE_KEY, str(self.product.pk))), 2)
+        self.assertFalse(self.redis.exists(redis_cart.PENDING_KEY))
+
+        redis_cart.forget_stock(self.product.pk)
+        self.assertTrue(redis_cart.load_stock(self.product.pk))
+        self.assertEqual(int(self.redis.get(redis_cart.get_stock_key(self.product.pk))), -1)
+
+    def test_cart_key_expires_with_hold(self):
+        redis_cart.add_product(self.user, self.product.id)
+
+        self.assertTrue(0 < self.redis.ttl(redis_cart.get_cart_key(self.user.pk)) <= settings.CART_HOLD_TIMEOUT)
+
+    def test_stock_not_loaded_while_applying(self):
+        self.redis.set(redis_cart.APPLY_LOCK_KEY, 'other')
+
+        with patch('shop.redis_cart.time.sleep'):
+            self.assertFalse(redis_cart.load_stock(self.product.pk))
+        self.assertFalse(self.redis.exists(redis_cart.get_stock_key(self.product.pk)))
+        self.assertEqual(redis_cart.apply_pending_stock(), 0)
+
+        self.redis.delete(redis_cart.APPLY_LOCK_KEY)
+        self.assertTrue(redis_cart.load_stock(self.product.pk))
+
+    def test_apply_bumps_generation(self):
+        generation = int(self.redis.get(redis_cart.GENERATION_KEY) or 0)
+        redis_cart.add_product(self.user, self.product.id)
+        redis_cart.apply_pending_stock()
+
+        self.assertEqual(int(self.redis.get(redis_cart.GENERATION_KEY)), generation + 1)
+        self.assertFalse(self.redis.exists(redis_cart.APPLY_LOCK_KEY))
+
+    def test_reservation_is_guarded(self):
+        self.assertIsNone(redis_cart.add_product(self.user, self.product.id, 4))
+        self.assertEqual(redis_cart.add_product(self.user, self.product.id, 3), (3, 0))
+        self.assertIsNone(redis_cart.add_product(self.user, self.product.id))
+
+        item_id = self.redis.hget(redis_cart.get_cart_key(self.user.pk), f'id:{self.product.id}').decode('utf-8')
+        self.assertEqual(redis_cart.delete_item(self.user, item_id), (0, 3))
+        self.assertIsNone(redis_cart.decrement_item(self.user, item_id))
+
+    def test_cart_page_and_order_persist_cart(self):
+        Street.objects.create(name='teststreet')
+        self.client.get(reverse('shop:cart_add', args=[self.product.id]))
+
+        response = self.client.get(reverse('shop:cart_list'))
+        self.assertEqual([item.count for item in response.context['cart']], [1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('shop:order_create'), {
+                'street': Street.objects.get().id, 'building': '1', 'apartment': '2', 'is_private': False,
+            })
+        self.assertTemplateUsed(response, 'shop/order_done.html')
+        self.assertEqual(redis_cart.read_cart(self.user.pk)[1], {})
+        redis_cart.persist_carts()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 2)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_failed_order_keeps_redis_cart(self):
+        Street.objects.create(name='teststreet')
+        redis_cart.add_product(self.user, self.product.id, 2)
+
+        with patch('shop.views.F', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('shop:order_create'), {
+                    'street': Street.objects.get().id, 'building': '1', 'apartment': '2', 'is_private': False,
+                })
+
+        self.assertEqual(redis_cart.read_cart(self.user.pk)[1][str(self.product.pk)][1], 2)
+        redis_cart.persist_carts()
+        self.assertEqual(Cart.objects.get(user=self.user).count, 2)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 1)
+
+    def test_expired_holds_released(self):
+        redis_cart.add_product(self.user, self.product.id, 2)
+        redis_cart.persist_carts()
+        Cart.objects.update(updated=timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT + 1))
+
+        self.assertEqual(redis_cart.release_expired_holds(), 2)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 3)
+        self.assertEqual(redis_cart.add_product(self.user, self.product.id, 3), (3, 0))
+
+    def test_release_keeps_changes_made_after_persist(self):
+        redis_cart.add_product(self.user, self.product.id, 2)
+        redis_cart.persist_carts()
+        Cart.objects.update(updated=timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT + 1))
+        redis_cart.add_product(self.user, self.product.id)
+
+        with patch('shop.redis_cart.persist_carts'):
+            self.assertEqual(redis_cart.release_expired_holds(), 2)
+        self.assertEqual(redis_cart.persist_carts(), 1)
+        self.assertEqual(Cart.objects.get(user=self.user).count, 1)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 2)
+
+    def test_release_after_decrement_does_not_overstock(self):
+        redis_cart.add_product(self.user, self.product.id, 2)
+        redis_cart.persist_carts()
+        Cart.objects.update(updated=timezone.now() - timedelta(seconds=settings.CART_HOLD_TIMEOUT + 1))
+        item_id = self.redis.hget(redis_cart.get_cart_key(self.user.pk), f'id:{self.product.id}').decode('utf-8')
+        redis_cart.decrement_item(self.user, item_id)
+
+        with patch('shop.redis_cart.persist_carts'):
+            self.assertEqual(redis_cart.release_expired_holds(), 2)
+        redis_cart.persist_carts()
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).count, 3)
+
+    def test_stock_counter_reset_on_product_save(self):
+        redis_cart.add_product(self.user, self.product.id)
+        self.product.count = 10
+        self.product.save()
+
+        self.assertFalse(self.redis.exists(redis_cart.get_stock_key(self.product.pk)))
+        self.assertEqual(redis_cart.add_product(self.user, self.product.id), (2, 8))
 
 
 class OrderCreateViewTests(TestCase):
@@ -729,8 +2450,6 @@ class OrderCreateViewTests(TestCase):
         self.user.save()
         self.client.force_login(self.user)
 
-        Cart.objects.create(user=self.user, product=self.product, price=self.product.price, count=1)
-
         data = {
             'building': '123',
             'apartment': '45',
@@ -742,6 +2461,33 @@ class OrderCreateViewTests(TestCase):
         self.assertTemplateUsed(response, 'shop/cart_list.html')
         self.assertFormError(response.context['form'], 'street', 'Обязательное поле.')
 
+    def test_order_not_created_when_hold_released(self):
+        self.client.force_login(self.user)
+
+        def sweep(form):
+            Cart.objects.filter(pk=self.cart_item.pk).delete()
+            return True
+
+        with patch('shop.views.OrderForm.is_valid', autospec=True, side_effect=sweep):
+            response = self.client.post(self.url, self.valid_form_data)
+
+        self.assertRedirects(response, reverse('shop:cart_list'))
+        self.assertEqual(Order.objects.count(), 0)
+
+    def test_order_not_created_when_count_changed(self):
+        self.client.force_login(self.user)
+
+        def increment(form):
+            Cart.objects.filter(pk=self.cart_item.pk).update(count=F('count') + 1)
+            return True
+
+        with patch('shop.views.OrderForm.is_valid', autospec=True, side_effect=increment):
+            response = self.client.post(self.url, self.valid_form_data)
+
+        self.assertRedirects(response, reverse('shop:cart_list'))
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertEqual(Cart.objects.get(pk=self.cart_item.pk).count, 3)
+
     def test_login_required(self):
         response = self.client.post(self.url, self.valid_form_data)
         self.assertEqual(response.status_code, 302)
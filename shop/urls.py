@@ -16,7 +16,10 @@ urlpatterns = [
     path('cart/add/<uuid:id>/',CartAddProductView.as_view(),name='cart_add'),
     path('cart/',CartListView.as_view(),name='cart_list'),
 
+    path('search/autocomplete/',ProductAutocompleteView.as_view(),name='product_autocomplete'),
+    path('search/',ProductSearchView.as_view(),name='product_search'),
     path('review/delete/<id>/',ReviewDeleteView.as_view(),name='review_delete'),
+    path('product/<slug:slug>/reviews/',ProductReviewListView.as_view(),name='product_reviews'),
     path('product/<slug:slug>/',ProductDetailView.as_view(),name='product_detail'),
     path('<slug:category_slug>/',ProductListView.as_view(),name='product_list_by_category'),
     path('',ProductListView.as_view(),name='product_list'),
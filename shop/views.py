@@ -1,16 +1,29 @@
+import redis
 from django.shortcuts import render,redirect,get_object_or_404
 from .models import *
 from .forms import *
 from django.contrib.auth.mixins import LoginRequiredMixin,AccessMixin
 from django.core.cache import cache
-from django.db.models import F
+from django.db.models import Exists,F,OuterRef
 from django.views.generic import DetailView,ListView,View,TemplateView,FormView
-from django.http import JsonResponse
+from django.http import Http404,JsonResponse
+from django.urls import reverse
 from django.db import transaction
-from django.core.paginator import Paginator
+from django.utils.decorators import method_decorator
+from django.views.decorators.vary import vary_on_headers
+from chillsip import singleflight
+from chillsip.pagecache import cache_anonymous_page
+from chillsip.stamps import stamp_condition
+from .cart import get_cart_engine
 from .recommender import Recommender
+from .search import autocomplete_products,search_products
+from .catalog import (
+    CATALOG_TIMEOUT,CatalogPage,get_catalog_stamp,get_categories,get_category,get_facet_counts,get_page_key,
+    REVIEWS_PAGE_SIZE,get_product_stamp,get_random_products,
+)
 
 
+@method_decorator(cache_anonymous_page(),name='dispatch')
 class AboutTemplateView(TemplateView):
     template_name = 'shop/about.html'
     extra_context = {
@@ -18,6 +31,22 @@ class AboutTemplateView(TemplateView):
     }
 
 
+def get_request_catalog_stamp(request,category_slug=None,**kwargs):
+    return get_catalog_stamp(get_category(category_slug).id if category_slug else None)
+
+
+def get_request_product_stamp(request,slug,**kwargs):
+    return get_product_stamp(slug)
+
+
+@method_decorator(
+    [
+        vary_on_headers('HX-Request'),
+        stamp_condition('catalog',get_request_catalog_stamp),
+        cache_anonymous_page(get_request_catalog_stamp),
+    ],
+    name='dispatch',
+)
 class ProductListView(ListView):
     model = Product
     template_name = 'shop/product_list.html'
@@ -25,48 +54,58 @@ class ProductListView(ListView):
     paginate_by = 8
     
     def get_queryset(self):
-       
         category_slug = self.kwargs.get('category_slug')
-        cache_key = f"product_{category_slug or 'all'}"
-        
-        cached_data = cache.get(cache_key)
-        if cached_data:
-            queryset,self.category = cached_data
-            return queryset
-        
-        queryset = super().get_queryset().defer('count','price')
+        queryset = super().get_queryset().defer('search_vector').order_by('-created','id')
         self.category = None
 
         if category_slug:
-            category_cache_key = f'category:{category_slug}'
-            self.category = cache.get(category_cache_key)
-
-            if not self.category:
-                self.category = get_object_or_404(Category,slug=category_slug)
-                cache.set(cache_key,(queryset,self.category,60 * 60 * 24))
-            
+            self.category = get_category(category_slug)
             queryset = queryset.filter(category=self.category)
-        
-        cache.set(cache_key, (queryset, self.category), 60 * 60)
 
-        return queryset
+        self.filter_form = ProductFilterForm(self.request.GET)
+        return queryset.filter(self.filter_form.get_condition())
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get('cursor')
+        page = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        partial = bool(self.request.headers.get('HX-Request'))
+        cache_key = get_page_key(
+            self.category,
+            f'c{cursor}' if cursor else page,
+            partial,
+            self.filter_form.get_query_string(),
+        )
+
+        catalog_page = cache.get(cache_key)
+        if catalog_page is None:
+            if cursor:
+                try:
+                    catalog_page = CatalogPage.from_cursor(queryset,cursor,page_size)
+                except ValueError as e:
+                    raise Http404(str(e))
+            else:
+                page_obj = super().paginate_queryset(queryset,page_size)[1]
+                catalog_page = CatalogPage.from_page(page_obj)
+            cache.set(cache_key,catalog_page,CATALOG_TIMEOUT)
+
+        return (None,catalog_page,catalog_page.object_list,catalog_page.is_paginated)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = cache.get_or_set(
-            'category_all',
-            lambda: Category.objects.all(),
-            60 * 60 * 24,
-        ) 
-        context['random_products'] = cache.get_or_set(
-            'random_products',
-            lambda: list(Product.objects.exclude(image__isnull=True)
-                        .exclude(image='')
-                        .order_by('?')[:20]
-            ),
-            60 * 60,
-        )
+        context['categories'] = get_categories()
+        try:
+            context['random_products'] = singleflight.get_or_set(
+                'random_products',
+                get_random_products,
+                60 * 60,
+            )
+        except redis.RedisError as e:
+            print(e)
+            context['random_products'] = []
         context['category'] = self.category
+        context['filter_form'] = self.filter_form
+        context['filter_query'] = self.filter_form.get_query_string()
+        context['facets'] = self.filter_form.get_facets(get_facet_counts(self.category))
         context['site_section'] = 'product_list'
 
         return context
@@ -78,27 +117,111 @@ class ProductListView(ListView):
         return ['shop/product_list.html']
 
 
+def get_reviews(product):
+    return product.feedback.filter(HAS_REVIEW).select_related('user')
+
+
+@method_decorator(
+    [vary_on_headers('HX-Request'),cache_anonymous_page(get_request_catalog_stamp)],
+    name='dispatch',
+)
+class ProductSearchView(TemplateView):
+    template_name = 'shop/product_search.html'
+    paginate_by = 8
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q','').strip()
+        products,next_cursor = [],None
+
+        if query:
+            try:
+                products,next_cursor = search_products(
+                    query,
+                    self.request.GET.get('cursor'),
+                    self.paginate_by,
+                )
+            except ValueError as e:
+                raise Http404(str(e))
+
+        context['query'] = query
+        context['products'] = products
+        context['next_cursor'] = next_cursor
+        context['site_section'] = 'product_list'
+        return context
+
+    def get_template_names(self):
+        if self.request.headers.get('HX-Request'):
+            return ['shop/product_search_partial.html']
+
+        return ['shop/product_search.html']
+
+
+class ProductAutocompleteView(View):
+    def get(self,request,*args,**kwargs):
+        results = autocomplete_products(request.GET.get('q',''))
+
+        return JsonResponse({
+            'results':[
+                {
+                    'name':item['name'],
+                    'slug':item['slug'],
+                    'url':reverse('shop:product_detail',args=[item['slug']]),
+                }
+                for item in results
+            ],
+        })
+
+
+@method_decorator(
+    [stamp_condition('product',get_request_product_stamp),cache_anonymous_page(get_request_product_stamp)],
+    name='dispatch',
+)
 class ProductDetailView(DetailView):
     model = Product
     template_name = 'shop/product_detail.html'
     context_object_name = 'product'
 
+    def get_queryset(self):
+        queryset = super().get_queryset().select_related('category').defer('search_vector')
+
+        if self.request.user.is_authenticated:
+            queryset = queryset.annotate(
+                is_in_cart=Exists(Cart.objects.filter(user=self.request.user,product=OuterRef('pk')))
+            )
+        return queryset
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        product = self.object
-        is_product_in_cart = False
+        context['is_product_in_cart'] = getattr(self.object,'is_in_cart',False)
+        try:
+            context['reviews'] = CatalogPage.from_cursor(
+                get_reviews(self.object),self.request.GET.get('reviews_cursor'),REVIEWS_PAGE_SIZE
+            )
+        except ValueError as e:
+            raise Http404(str(e))
+        return context
 
-        if self.request.user.is_authenticated:
-            is_product_in_cart = self.request.user.cart.filter(product=product).exists()
 
-        context['is_product_in_cart'] = is_product_in_cart
+@method_decorator(
+    [stamp_condition('product',get_request_product_stamp),cache_anonymous_page(get_request_product_stamp)],
+    name='dispatch',
+)
+class ProductReviewListView(TemplateView):
+    template_name = 'shop/review_partial.html'
 
-        feedbacks = self.object.feedback.exclude(review__isnull=True).exclude(review='')
-        paginator = Paginator(feedbacks,3)
-        page = self.request.GET.get('page')
-        context['feedbacks'] = paginator.get_page(page)
-        return context
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        product = get_object_or_404(Product.objects.only('id','slug'),slug=self.kwargs['slug'])
+
+        try:
+            reviews = CatalogPage.from_cursor(get_reviews(product),self.request.GET.get('cursor'),REVIEWS_PAGE_SIZE)
+        except ValueError as e:
+            raise Http404(str(e))
 
+        context['product'] = product
+        context['reviews'] = reviews
+        return context
 
 
 class CartListView(LoginRequiredMixin,ListView):
@@ -106,6 +229,7 @@ class CartListView(LoginRequiredMixin,ListView):
     context_object_name = 'cart'
 
     def get_queryset(self):
+        get_cart_engine().persist_cart(self.request.user)
         return Cart.objects.filter(user=self.request.user).select_related('product')
 
     def get_context_data(self, **kwargs):
@@ -127,63 +251,31 @@ class CartListView(LoginRequiredMixin,ListView):
 
 class CartAddProductView(LoginRequiredMixin,View):
     def get(self,request,id,*args,**kwargs):
-        product = get_object_or_404(Product,id=id)
-
-        if product.count == 0:
+        if get_cart_engine().add_product(request.user,id) is None:
+            product = get_object_or_404(Product,id=id)
             return redirect(product.get_absolute_url())
-        
-        with transaction.atomic():
-            cart_item, created = Cart.objects.get_or_create(
-                user = request.user,
-                product = product,
-                defaults={'price': product.price, 'count': 1}
-            )
-            if not created:
-                cart_item.count = F('count') + 1
-                cart_item.save(update_fields=['count'])
-                cart_item.refresh_from_db()
-        
-            product.count = F('count') - 1
-            product.save(update_fields=['count'])
-            product.refresh_from_db()
 
         return redirect('shop:cart_list')
 
 
 class CartDeleteProductView(LoginRequiredMixin,View):
     def get(self,request,id,*args,**kwargs):
-        cart_item = get_object_or_404(Cart,id=id,user=request.user)
-        product = get_object_or_404(Product,id = cart_item.product_id)
-
-        with transaction.atomic():
-            product.count = F('count') + cart_item.count
-            product.save(update_fields=['count'])
-            product.refresh_from_db()
-            cart_item.delete()
+        if get_cart_engine().delete_item(request.user,id) is None:
+            raise Http404
 
         return redirect('shop:cart_list')
 
 
 class CartIncrementView(LoginRequiredMixin,View):
     def get(self,request,id,*args,**kwargs):
-        cart_item = get_object_or_404(Cart,id=id,user=request.user)
-        product = get_object_or_404(Product,id = cart_item.product_id)
-
-        if product.count > 0:
-
-            with transaction.atomic():
-                cart_item.count = F('count') + 1
-                product.count = F('count') - 1 
-                product.save(update_fields=['count'])
-                product.refresh_from_db()
-                cart_item.save(update_fields=['count'])
-                cart_item.refresh_from_db()
+        counts = get_cart_engine().increment_item(request.user,id)
 
+        if counts:
             return JsonResponse(
-                
                 {
                     'success':True,
-                    'new_count':cart_item.count,
+                    'new_count':counts[0],
+                    'product_count':counts[1],
                 }
             )
         return JsonResponse(
@@ -194,34 +286,27 @@ class CartIncrementView(LoginRequiredMixin,View):
 
 class CartDecrementView(LoginRequiredMixin,View):
     def get(self,request,id,*args,**kwargs):
-        cart_item = get_object_or_404(Cart,id=id,user=request.user)
-        product = get_object_or_404(Product,id = cart_item.product_id)
-
-        if cart_item.count > 1:
-
-            with transaction.atomic():
-                cart_item.count = F('count') - 1
-                product.count = F('count') + 1 
-                product.save(update_fields=['count'])
-                product.refresh_from_db()
-                cart_item.save(update_fields=['count'])
-                cart_item.refresh_from_db()
+        counts = get_cart_engine().decrement_item(request.user,id)
 
+        if counts:
             return JsonResponse(
                 {
                     'success':True,
-                    'new_count':cart_item.count,
+                    'new_count':counts[0],
+                    'product_count':counts[1],
                 }
             )
-        
         return JsonResponse(
             {'success':False},
             status=400
         )
 
+
 class OrderCreateView(LoginRequiredMixin,View):
     def post(self,request,*args,**kwargs):
         user = self.request.user
+        engine = get_cart_engine()
+        engine.persist_cart(user)
         cart = Cart.objects.filter(user=user).select_related('product')
         total = sum(item.get_cost() for item in cart)
 
@@ -232,6 +317,10 @@ class OrderCreateView(LoginRequiredMixin,View):
 
         if form.is_valid():      
             with transaction.atomic():
+                held = list(Cart.objects.select_for_update(of=('self',)).filter(user=user).select_related('product'))
+                if {(item.id,item.count) for item in held} != {(item.id,item.count) for item in cart}:
+                    return redirect('shop:cart_list')
+
                 cd = form.cleaned_data
                 apartment = None if cd['is_private'] else cd['apartment']
 
@@ -245,7 +334,7 @@ class OrderCreateView(LoginRequiredMixin,View):
 
                 )
                 products = []
-                for item in cart:
+                for item in held:
                     products.append(item.product)
                     ProductInOrder.objects.create (
                         product = item.product,
@@ -261,11 +350,13 @@ class OrderCreateView(LoginRequiredMixin,View):
                     print(e)
                     pass
                 
-                cart.delete()
+                items = [(item.product_id,item.count) for item in held]
+                transaction.on_commit(lambda: engine.forget_cart(user,items))
+                Cart.objects.filter(id__in=[item.id for item in held]).delete()
                 user.account = F('account') - total
                 user.save(update_fields=['account'])
                 user.refresh_from_db()
-            
+
             return render(self.request,'shop/order_done.html',{'order_id':order.id})
         
       